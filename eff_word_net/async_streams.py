@@ -0,0 +1,106 @@
+"""
+asyncio counterpart of CustomAudioStream, for audio arriving on the event
+loop (websockets, async file readers etc). Use it with
+HotwordDetector.listen / MultiHotwordDetector.listen
+"""
+
+import asyncio
+from collections import deque
+from typing import AsyncIterable, AsyncIterator
+
+import numpy as np
+
+from eff_word_net import RATE
+from eff_word_net.streams import CustomAudioStream
+
+
+async def memory_source(
+    audio: np.array, chunk_frames: int = 1024, realtime: bool = False
+) -> AsyncIterator[np.array]:
+    """
+    Async source yielding an in-memory 16000Hz recording (for example a
+    decoded WAV file) in chunks, useful to test async pipelines without a
+    network or audio device
+
+    Inp Parameters:
+
+        audio : np.array of 1channel 16000Hz sampled audio
+
+        chunk_frames : samples per chunk, needs not match the stream hop
+
+        realtime : sleep chunk duration between chunks instead of just
+        yielding control to the event loop
+    """
+    for start in range(0, audio.shape[0], chunk_frames):
+        await asyncio.sleep(chunk_frames / RATE if realtime else 0)
+        yield audio[start : start + chunk_frames]
+
+
+class AsyncAudioStream:
+    """
+    Sliding window over an async source of audio chunks of any size
+
+    Chunks are cut into sliding_window_secs hops which are fed to a
+    CustomAudioStream, so windows are the same as the synchronous stream
+    would produce. Iterate it with async for, iteration ends with the source
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterable[np.array],
+        window_length_secs=1,
+        sliding_window_secs: float = 1 / 8,
+        dtype=np.float64,
+    ):
+        """
+        Inp Parameters:
+
+            source : async iterable of 1channel 16000Hz audio chunks
+
+            window_length_secs, sliding_window_secs, dtype : as in
+            CustomAudioStream
+        """
+        self._source = source.__aiter__()
+        self._hop_frames = int(sliding_window_secs * RATE)
+        self._leftover = np.zeros(0, dtype=dtype)
+        self._hops = deque()
+        self._stream = CustomAudioStream(
+            open_stream=lambda: None,
+            close_stream=lambda: None,
+            get_next_frame=self._hops.popleft,
+            window_length_secs=window_length_secs,
+            sliding_window_secs=sliding_window_secs,
+            dtype=dtype,
+        )
+
+    def _splitChunk(self, chunk: np.array):
+        self._leftover = np.concatenate((self._leftover, chunk))
+        n_hops = self._leftover.shape[0] // self._hop_frames
+        for i in range(n_hops):
+            self._hops.append(
+                self._leftover[i * self._hop_frames : (i + 1) * self._hop_frames]
+            )
+        self._leftover = self._leftover[n_hops * self._hop_frames :]
+
+    async def getFrame(self):
+        """
+        Waits for the next window, returns None once the source is
+        exhausted. The returned array is only valid till the next getFrame
+        call, copy it to keep it around
+        """
+        while len(self._hops) == 0:
+            try:
+                chunk = await self._source.__anext__()
+            except StopAsyncIteration:
+                return None
+            self._splitChunk(chunk)
+        return self._stream.getFrame()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self.getFrame()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
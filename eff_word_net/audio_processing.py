@@ -4,122 +4,541 @@ import numpy as np
 import random
 from pprint import pprint
 import json
-import onnxruntime as rt
+import threading
+import zlib
+from time import perf_counter
 
-from eff_word_net.audio_utils import logfbank
+from eff_word_net.audio_utils import LogfbankExtractor, StreamingLogfbank
 
 LIB_FOLDER_LOCATION = os.path.dirname(os.path.realpath(__file__))
 
+EXECUTION_MODES = ("sequential", "parallel")
+GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+
+
+def build_session_options(
+    intra_op_num_threads: int = None,
+    inter_op_num_threads: int = None,
+    execution_mode: str = None,
+    graph_optimization_level: str = None,
+    enable_cpu_mem_arena: bool = None,
+    enable_mem_pattern: bool = None,
+) -> "onnxruntime.SessionOptions":
+    """
+    onnxruntime SessionOptions from plain values, options left to None keep
+    the onnxruntime defaults
+
+    Inp Parameters:
+
+        intra_op_num_threads, inter_op_num_threads : thread pool sizes
+
+        execution_mode : "sequential" or "parallel", parallel runs
+        independent graph branches on the inter op pool
+
+        graph_optimization_level : "disable", "basic", "extended" or "all"
+
+        enable_cpu_mem_arena : pool cpu allocations in an arena, disabling
+        it lowers resident memory at some latency cost
+
+        enable_mem_pattern : preplan allocations for repeated input shapes
+    """
+    import onnxruntime as rt
+
+    sess_options = rt.SessionOptions()
+    if intra_op_num_threads is not None:
+        sess_options.intra_op_num_threads = intra_op_num_threads
+    if inter_op_num_threads is not None:
+        sess_options.inter_op_num_threads = inter_op_num_threads
+
+    if execution_mode is not None:
+        assert execution_mode in EXECUTION_MODES, (
+            f"execution_mode should be one of {EXECUTION_MODES}"
+        )
+        sess_options.execution_mode = {
+            "sequential": rt.ExecutionMode.ORT_SEQUENTIAL,
+            "parallel": rt.ExecutionMode.ORT_PARALLEL,
+        }[execution_mode]
+
+    if graph_optimization_level is not None:
+        assert graph_optimization_level in GRAPH_OPTIMIZATION_LEVELS, (
+            f"graph_optimization_level should be one of {GRAPH_OPTIMIZATION_LEVELS}"
+        )
+        sess_options.graph_optimization_level = {
+            "disable": rt.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": rt.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": rt.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": rt.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[graph_optimization_level]
+
+    if enable_cpu_mem_arena is not None:
+        sess_options.enable_cpu_mem_arena = enable_cpu_mem_arena
+    if enable_mem_pattern is not None:
+        sess_options.enable_mem_pattern = enable_mem_pattern
+    return sess_options
+
+
+def _read_optimized_model_info(optimized_model_path: str) -> dict:
+    """
+    Build info stored next to an optimized graph cache, None when the cache
+    or its info file is missing
+    """
+    info_path = optimized_model_path + ".json"
+    if not (os.path.isfile(optimized_model_path) and os.path.isfile(info_path)):
+        return None
+    try:
+        return json.loads(open(info_path, "r").read())
+    except ValueError:
+        return None
+
 
 class ModelRawBackend:
     def __init__(self, use_quantized_model=False):
         self.use_quantized_model = use_quantized_model
         self.window_length = None
         self.window_frames = None
-        pass
+        # held by async listen while scoring, so concurrent listeners on
+        # detectors sharing this model run inference one at a time
+        self.inference_lock = threading.Lock()
 
-    def _randomCrop(self, x: np.array, length=16000) -> np.array:
+    @property
+    def model_variant(self) -> str:
+        """
+        Weights variant recorded in reference files, embeddings of
+        different variants are close but not identical
+        """
+        return "int8" if self.use_quantized_model else "fp32"
+
+    @staticmethod
+    def _randint(rng: np.random.Generator, low: int, high: int) -> int:
+        """
+        Random int in [low, high], drawn from rng when given else from the
+        random module
+        """
+        if rng is None:
+            return random.randint(low, high)
+        return int(rng.integers(low, high + 1))
+
+    def _randomCrop(self, x: np.array, length=16000, rng=None) -> np.array:
         assert x.shape[0] > self.window_frames
-        frontBits = random.randint(0, x.shape[0] - length)
+        frontBits = self._randint(rng, 0, x.shape[0] - length)
         return x[frontBits : frontBits + length]
 
-    def _addPadding(self, x: np.array, length=16000) -> np.array:
+    def _addPadding(self, x: np.array, length=16000, rng=None) -> np.array:
         assert x.shape[0] < length
         bitCountToBeAdded = length - x.shape[0]
-        frontBits = random.randint(0, bitCountToBeAdded)
+        frontBits = self._randint(rng, 0, bitCountToBeAdded)
         # print(frontBits, bitCountToBeAdded-frontBits)
-        new_x = np.append(np.zeros(frontBits), x)
-        new_x = np.append(new_x, np.zeros(bitCountToBeAdded - frontBits))
+        # float input keeps its dtype, the padding is written around it once
+        dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+        new_x = np.zeros(length, dtype=dtype)
+        new_x[frontBits : frontBits + x.shape[0]] = x
         return new_x
 
-    def _removeExistingPadding(self, x: np.array) -> np.array:
-        lastZeroBitBeforeAudio = 0
-        firstZeroBitAfterAudio = len(x)
-        for i in range(len(x)):
-            if x[i] == 0:
-                lastZeroBitBeforeAudio = i
-            else:
-                break
-        for i in range(len(x) - 1, 1, -1):
-            if x[i] == 0:
-                firstZeroBitAfterAudio = i
-            else:
-                break
-        return x[lastZeroBitBeforeAudio:firstZeroBitAfterAudio]
+    @staticmethod
+    def _trimBounds(x: np.array, threshold: float = 0.0):
+        """
+        Slice bounds of the audio along the last axis of x, keeping one
+        silent sample before the audio and never cutting below the first 2
+        samples. Silence is samples whose magnitude is at most threshold
+        (exact zeros by default). Works on a clip or a 2D array of clips
+        """
+        length = x.shape[-1]
+        if length == 0:
+            return np.zeros(x.shape[:-1], dtype=np.int64), np.zeros(x.shape[:-1], dtype=np.int64)
+        audio = np.abs(x) > threshold if threshold > 0 else x != 0
+        has_audio = audio.any(axis=-1)
+        # argmax of a bool array stops at the first True
+        firstAudioBit = np.where(has_audio, audio.argmax(axis=-1), length)
+        lastAudioBit = np.where(has_audio, length - 1 - audio[..., ::-1].argmax(axis=-1), -1)
+        lastZeroBitBeforeAudio = np.maximum(firstAudioBit - 1, 0)
+        firstZeroBitAfterAudio = np.minimum(length, np.maximum(lastAudioBit + 1, 2))
+        return lastZeroBitBeforeAudio, firstZeroBitAfterAudio
+
+    def _removeExistingPadding(self, x: np.array, threshold: float = 0.0) -> np.array:
+        """
+        Strips silence from both ends, see _trimBounds
+        """
+        start, end = self._trimBounds(x, threshold)
+        return x[int(start) : int(end)]
 
-    def fixPaddingIssues(self, x: np.array) -> np.array:
-        x = self._removeExistingPadding(x)
+    def fixPaddingIssues(
+        self, x: np.array, rng: np.random.Generator = None, threshold: float = 0.0
+    ) -> np.array:
+        """
+        Trims existing zero padding and randomly crops or pads the audio to
+        window_frames, positions are drawn from rng when given
+
+        threshold : samples up to this magnitude count as padding, the
+        default only trims exact zeros
+        """
+        x = self._removeExistingPadding(x, threshold)
         # print("Preprocessing Shape",x.shape[0])
         if x.shape[0] > self.window_frames:
-            return self._randomCrop(x, length=self.window_frames)
+            return self._randomCrop(x, length=self.window_frames, rng=rng)
         elif x.shape[0] < self.window_frames:
-            return self._addPadding(x, length=self.window_frames)
+            return self._addPadding(x, length=self.window_frames, rng=rng)
         else:
             return x
 
+    def fixPaddingIssuesBatch(
+        self, clips: list, rng: np.random.Generator = None, threshold: float = 0.0
+    ) -> np.array:
+        """
+        fixPaddingIssues over many clips at once, crop and pad positions are
+        drawn in one call and the windows are written into one preallocated
+        array, silence is located in a single vectorized pass for a 2D array
+
+        Inp Parameters:
+
+            clips : list of 1channel 16000Hz clips of any length, or a 2D
+            array of equal length clips
+
+            rng : np.random.Generator choosing crop and pad positions, a
+            fresh unseeded one when None
+
+            threshold : as in fixPaddingIssues
+
+        Out Parameters:
+
+            np.array of shape (len(clips), window_frames) float32 windows
+        """
+        rng = rng or np.random.default_rng()
+        if isinstance(clips, np.ndarray) and clips.ndim == 2:
+            starts, ends = self._trimBounds(clips, threshold)
+        else:
+            bounds = np.array(
+                [self._trimBounds(np.asarray(clip), threshold) for clip in clips],
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            starts, ends = bounds[:, 0], bounds[:, 1]
+        # all silent clips give start past end, an empty slice like x[start:end]
+        trimmed = np.maximum(ends - starts, 0)
+
+        # crops pick where the window starts in the clip, pads where the
+        # clip starts in the window
+        shifts = rng.integers(0, np.abs(trimmed - self.window_frames) + 1)
+        windows = np.zeros((len(clips), self.window_frames), dtype=np.float32)
+        for i, (start, n, shift) in enumerate(zip(starts, trimmed, shifts)):
+            clip = clips[i][start : start + n]
+            if n >= self.window_frames:
+                windows[i] = clip[shift : shift + self.window_frames]
+            else:
+                windows[i, shift : shift + n] = clip
+        return windows
+
+    def augmentedWindows(
+        self, x: np.array, n_variants: int = 1, seed: int = 0, gain_db: float = 6.0
+    ) -> np.array:
+        """
+        Reproducible fixPaddingIssues variants of a sample for reference
+        generation, each variant is cropped or padded at its own position
+        and all but the first get a random gain
+
+        Inp Parameters:
+
+            x : 1channel 16000Hz audio of a hotword sample
+
+            n_variants : number of windows generated
+
+            seed : variants depend only on seed and the audio content, so
+            the same file always gives the same windows
+
+            gain_db : gains are drawn uniformly within +-gain_db
+
+        Out Parameters:
+
+            np.array of shape (n_variants, window_frames) float32 windows
+        """
+        assert n_variants > 0, "n_variants should be atleast 1"
+        x = self._removeExistingPadding(np.asarray(x))
+        rng = np.random.default_rng(
+            [seed, zlib.crc32(np.ascontiguousarray(x).tobytes())]
+        )
+
+        # x is already trimmed, trimming again leaves it unchanged
+        windows = self.fixPaddingIssuesBatch([x] * n_variants, rng=rng)
+        gains = 10 ** (rng.uniform(-gain_db, gain_db, n_variants) / 20)
+        gains[0] = 1.0
+        windows *= gains[:, np.newaxis].astype(np.float32)
+        return windows
+
     def scoreVector(self, inp_vector: np.array, embeddings: np.array) -> np.array:
         raise NotImplementedError("Vector scoring attempted on raw model backend")
 
+    def scoreVectorGroups(
+        self, inp_vector: np.array, embeddings: np.array, group_starts: np.array
+    ) -> np.array:
+        raise NotImplementedError("Vector scoring attempted on raw model backend")
+
     def audioToVector(self, inpAudio: np.array) -> np.array:
         raise NotImplementedError("Vector Convertion on raw model backend invoked")
 
+    def featuresToVector(self, features: np.array) -> np.array:
+        raise NotImplementedError("Vector Convertion on raw model backend invoked")
+
+    def audioToVectors(self, inpAudioBatch: np.array, max_batch_size=None) -> np.array:
+        raise NotImplementedError("Vector Convertion on raw model backend invoked")
+
 
 class First_Iteration_Siamese(ModelRawBackend):
-    def __init__(self):
+    def __init__(self, use_quantized_model=False):
         super().__init__()
         raise ValueError("The model is no more supported")
 
 
 class Resnet50_Arc_loss(ModelRawBackend):
-    def __init__(self):
-        super().__init__()
+    def __init__(
+        self,
+        max_batch_size: int = 32,
+        use_quantized_model: bool = False,
+        sliding_window_secs: float = None,
+        feature_dtype=np.float64,
+        intra_op_num_threads: int = None,
+        inter_op_num_threads: int = None,
+        execution_mode: str = None,
+        graph_optimization_level: str = None,
+        enable_cpu_mem_arena: bool = None,
+        enable_mem_pattern: bool = None,
+        optimized_model_path: str = None,
+        io_binding: bool = False,
+        lazy: bool = False,
+        warmup_runs: int = 1,
+    ):
+        """
+        Inp Parameters:
+
+            max_batch_size : max number of windows sent to the onnx session
+            in a single run by audioToVectors, larger batches are split
+
+            use_quantized_model : run the int8 quantized model, smaller and
+            faster on most CPUs at a small accuracy cost. Reference files
+            should be generated with the same variant
+
+            sliding_window_secs : hop of the audio stream feeding audioToVector,
+            when given log-fbank frames shared with the previous window are
+            reused instead of being recomputed. Works best when it is a
+            multiple of 10ms
+
+            feature_dtype : np.float64 (default) or np.float32, float32 runs
+            the log-fbank pipeline in single precision with preallocated
+            buffers, matching the float64 features within ~1e-4. The
+            buffers are kept per thread, so audioToVector can still be
+            called from several threads at once (unlike with
+            sliding_window_secs or io_binding, whose state is shared)
+
+            intra_op_num_threads, inter_op_num_threads : onnxruntime thread
+            pool sizes, onnxruntime picks them when None. Set them low when
+            running several sessions in one host to avoid oversubscription
+
+            execution_mode, graph_optimization_level, enable_cpu_mem_arena,
+            enable_mem_pattern : see build_session_options
+
+            optimized_model_path : cache file of the optimized graph, it is
+            written on first use and loaded with graph optimizations
+            disabled afterwards, which shortens startup. The source model,
+            variant, graph_optimization_level and onnxruntime version it
+            was built from are stored in optimized_model_path + ".json",
+            the cache is rebuilt when any of them differs
+
+            io_binding : run audioToVector through an onnxruntime IOBinding
+            over preallocated input and output buffers, features are
+            computed straight into the bound input so the steady state
+            loop doesnt allocate. The returned embedding is then reused and
+            only valid till the next call, and the model must not be used
+            from several threads at once
+
+            lazy : load the onnx session on first inference instead of in
+            the constructor, no warmup is run, call warmup when the first
+            detection should not pay for it
+
+            warmup_runs : inferences on silence run by the constructor
+            when not lazy, 0 skips the warmup
+        """
+        super().__init__(use_quantized_model=use_quantized_model)
+
+        assert max_batch_size > 0, "max_batch_size should be atleast 1"
 
         self.window_length = 1.5
         self.window_frames = int(self.window_length * 16000)
+        self.max_batch_size = max_batch_size
 
-        if self.use_quantized_model:
-            self.onnx_sess = rt.InferenceSession(
-                os.path.join(
-                    LIB_FOLDER_LOCATION,
-                    "models/resnet_50_arc/slim_93%_accuracy_72.7390%_qint8.onnx",
-                ),
-                sess_options=rt.SessionOptions(),
-                providers=["CPUExecutionProvider"],
-            )
-        else:
-            self.onnx_sess = rt.InferenceSession(
-                os.path.join(
-                    LIB_FOLDER_LOCATION,
-                    "models/resnet_50_arc/slim_93%_accuracy_72.7390%.onnx",
-                ),
-                sess_options=rt.SessionOptions(),
-                providers=["CPUExecutionProvider"],
+        self.feature_extractor = LogfbankExtractor(
+            samplerate=16000,
+            winlen=0.025,
+            winstep=0.01,
+            nfilt=64,
+            nfft=512,
+            preemph=0.0,
+            dtype=feature_dtype,
+        )
+
+        self._bound_features = None
+        if io_binding:
+            n_frames = self.feature_extractor(np.zeros(self.window_frames)).shape[0]
+            self._bound_input = np.zeros((1, 1, n_frames, 64), dtype=np.float32)
+            self._bound_features = self._bound_input[0, 0]
+
+        self._streaming_features = None
+        if sliding_window_secs is not None:
+            self._streaming_features = StreamingLogfbank(
+                self.window_frames,
+                int(sliding_window_secs * 16000),
+                extractor=self.feature_extractor,
+                feat_buffer=self._bound_features,
             )
 
-        self.input_name: str = self.onnx_sess.get_inputs()[0].name
-        self.output_name: str = self.onnx_sess.get_outputs()[0].name
+        self._session_kwargs = dict(
+            intra_op_num_threads=intra_op_num_threads,
+            inter_op_num_threads=inter_op_num_threads,
+            execution_mode=execution_mode,
+            graph_optimization_level=graph_optimization_level,
+            enable_cpu_mem_arena=enable_cpu_mem_arena,
+            enable_mem_pattern=enable_mem_pattern,
+        )
+        self._optimized_model_path = optimized_model_path
+        self._use_io_binding = io_binding
+        self._io_binding = None
+        self._onnx_sess = None
+        self._session_lock = threading.Lock()
+
+        if not lazy:
+            self._loadSession()
+            self.warmup(warmup_runs)
 
-        self.audioToVector(
-            np.float32(
-                np.zeros(
-                    self.window_frames,
+    @property
+    def onnx_sess(self):
+        return self._loadSession()
+
+    def _loadSession(self):
+        """
+        Creates the onnx session (and io binding) on first call, later
+        calls return the existing session
+        """
+        if self._onnx_sess is not None:
+            return self._onnx_sess
+
+        with self._session_lock:
+            if self._onnx_sess is None:
+                self._createSession()
+        return self._onnx_sess
+
+    def _modelPath(self) -> str:
+        if self.use_quantized_model:
+            return os.path.join(
+                LIB_FOLDER_LOCATION,
+                "models/resnet_50_arc/slim_93%_accuracy_72.7390%_qint8.onnx",
+            )
+        return os.path.join(
+            LIB_FOLDER_LOCATION,
+            "models/resnet_50_arc/slim_93%_accuracy_72.7390%.onnx",
+        )
+
+    def _createSession(self):
+        import onnxruntime as rt
+
+        sess_options = build_session_options(**self._session_kwargs)
+        model_path = self._modelPath()
+
+        optimized_model_path = self._optimized_model_path
+        build_info = None
+        if optimized_model_path is not None:
+            build_info = {
+                "source_model": os.path.abspath(model_path),
+                "source_mtime": os.path.getmtime(model_path),
+                "model_variant": self.model_variant,
+                "graph_optimization_level": self._session_kwargs["graph_optimization_level"],
+                "onnxruntime_version": rt.__version__,
+            }
+            if _read_optimized_model_info(optimized_model_path) == build_info:
+                model_path = optimized_model_path
+                sess_options.graph_optimization_level = (
+                    rt.GraphOptimizationLevel.ORT_DISABLE_ALL
                 )
+            else:
+                # a stale info file must not vouch for the cache being rebuilt
+                if os.path.isfile(optimized_model_path + ".json"):
+                    os.remove(optimized_model_path + ".json")
+                sess_options.optimized_model_filepath = optimized_model_path
+
+        onnx_sess = rt.InferenceSession(
+            model_path,
+            sess_options=sess_options,
+            providers=["CPUExecutionProvider"],
+        )
+
+        if build_info is not None and model_path != optimized_model_path:
+            open(optimized_model_path + ".json", "w").write(json.dumps(build_info))
+
+        self.input_name: str = onnx_sess.get_inputs()[0].name
+        self.output_name: str = onnx_sess.get_outputs()[0].name
+
+        # models exported with a fixed batch dimension report it as an int,
+        # dynamic ones as a str/None
+        batch_dim = onnx_sess.get_inputs()[0].shape[0]
+        self._model_batch_limit = batch_dim if isinstance(batch_dim, int) else None
+
+        if self._use_io_binding:
+            embedding_size = onnx_sess.get_outputs()[0].shape[-1]
+            if not isinstance(embedding_size, int):
+                embedding_size = onnx_sess.run(
+                    [self.output_name], {self.input_name: self._bound_input}
+                )[0].shape[-1]
+            self._bound_output = np.zeros((1, embedding_size), dtype=np.float32)
+            self._io_binding = onnx_sess.io_binding()
+            self._io_binding.bind_input(
+                self.input_name,
+                "cpu",
+                0,
+                np.float32,
+                list(self._bound_input.shape),
+                self._bound_input.ctypes.data,
             )
-        )  # warmup inference
+            self._io_binding.bind_output(
+                self.output_name,
+                "cpu",
+                0,
+                np.float32,
+                list(self._bound_output.shape),
+                self._bound_output.ctypes.data,
+            )
+
+        self._onnx_sess = onnx_sess
+
+    def warmup(self, n: int = 1) -> list:
+        """
+        Loads the session if needed and runs n inferences on silence, so
+        onnxruntime allocations and kernel selection happen before the
+        first real window
+
+        Out Parameters:
+
+            list of the n inference latencies in seconds
+        """
+        self._loadSession()
+        silence = np.zeros(self.window_frames, dtype=np.float32)
+        latencies = []
+        for _ in range(n):
+            start = perf_counter()
+            self.featuresToVector(self.feature_extractor(silence))
+            latencies.append(perf_counter() - start)
+        if n > 0 and self._streaming_features is not None and self._bound_features is not None:
+            # with io_binding the streaming frame buffer is the bound input,
+            # which the warmup overwrote, so the next window starts afresh
+            self._streaming_features.reset()
+        return latencies
 
     def compute_logfbank_features(self, inpAudio: np.array) -> np.array:
         """
-        This assumes a mono channel input
+        This assumes a mono channel input, a 2D input is treated as a
+        batch of windows and returns (batch, frames, 64) features
         """
-        return logfbank(
-            inpAudio,
-            samplerate=16000,
-            winlen=0.025,
-            winstep=0.01,
-            nfilt=64,
-            nfft=512,
-            preemph=0.0,
-        )
+        single_window = inpAudio.shape == (self.window_frames,)
+        if self._streaming_features is not None and single_window:
+            return self._streaming_features(inpAudio)
+        if self._bound_features is not None and single_window:
+            return self.feature_extractor(inpAudio, out=self._bound_features)
+
+        return self.feature_extractor(inpAudio)
 
     def scoreVector(self, inp_vector: np.array, embeddings: np.array) -> np.array:
         # print(inp_vector.shape, embeddings.shape)
@@ -141,26 +560,107 @@ class Resnet50_Arc_loss(ModelRawBackend):
 
         return confidence_scores.max()
 
+    def scoreVectorGroups(
+        self, inp_vector: np.array, embeddings: np.array, group_starts: np.array
+    ) -> np.array:
+        """
+        Scores one embedding against several stacked reference sets at once
+
+        Inp Parameters:
+
+            inp_vector : embedding of shape (1, embedding_size)
+
+            embeddings : reference embeddings of all groups stacked along
+            the first axis
+
+            group_starts : sorted row index where each group begins
+
+        Out Parameters:
+
+            np.array with the max confidence score of each group, same as
+            scoreVector on each group separately
+        """
+        cosine_similarity = np.matmul(embeddings, inp_vector.ravel())
+        confidence_scores = (cosine_similarity + 1) / 2
+
+        return np.maximum.reduceat(confidence_scores, group_starts)
+
     def audioToVector(self, inpAudio: np.array) -> np.array:
         assert inpAudio.shape == (self.window_frames,)  # 1.5 sec long window
         features = self.compute_logfbank_features(inpAudio)
         # features_norm = self.min_max_normalize_features(features)
 
+        return self.featuresToVector(features)
+
+    def featuresToVector(self, features: np.array) -> np.array:
+        """
+        Embeds the compute_logfbank_features output of a single window,
+        lets callers inspect the features (voice activity gating) without
+        computing them twice
+        """
+        self._loadSession()
+        if self._io_binding is not None:
+            if features is not self._bound_features:
+                self._bound_features[:] = features
+            self.onnx_sess.run_with_iobinding(self._io_binding)
+            return self._bound_output
         output = self.onnx_sess.run(
             [self.output_name],
             {
-                self.input_name: np.float32(
-                    np.expand_dims(
-                        features,
-                        # features_norm,
-                        axis=(0, 1),  # adding channel and batch dimension
-                    )
-                )
+                # adding batch and channel dimension, without a copy for float32 features
+                self.input_name: np.asarray(features, dtype=np.float32)[
+                    np.newaxis, np.newaxis
+                ]
             },
         )[0]
 
         return output
 
+    def audioToVectors(self, inpAudioBatch: np.array, max_batch_size=None) -> np.array:
+        """
+        Converts a batch of 1.5 sec windows to embeddings, features for
+        the whole batch are computed in one vectorized pass
+
+        Inp Parameters:
+
+            inpAudioBatch : np.array of shape (N, 24000)
+
+            max_batch_size : overrides the max windows per onnx session run
+            set at construction
+
+        Out Parameters:
+
+            np.array of shape (N, embedding_size)
+        """
+        assert inpAudioBatch.ndim == 2 and inpAudioBatch.shape[1] == self.window_frames, (
+            f"Audio batch needs to be of shape (N, {self.window_frames})"
+        )
+        assert inpAudioBatch.shape[0] > 0, "Empty audio batch received"
+
+        self._loadSession()
+        max_batch_size = max_batch_size or self.max_batch_size
+        if self._model_batch_limit is not None:
+            max_batch_size = min(max_batch_size, self._model_batch_limit)
+
+        outputs = []
+        for start in range(0, inpAudioBatch.shape[0], max_batch_size):
+            features = self.compute_logfbank_features(
+                inpAudioBatch[start : start + max_batch_size]
+            )
+            outputs.append(
+                self.onnx_sess.run(
+                    [self.output_name],
+                    {
+                        # adding channel dimension
+                        self.input_name: np.asarray(features, dtype=np.float32)[
+                            :, np.newaxis
+                        ]
+                    },
+                )[0]
+            )
+
+        return np.concatenate(outputs, axis=0)
+
 
 from enum import Enum
 
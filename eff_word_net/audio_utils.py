@@ -1,8 +1,9 @@
-import onnxruntime as rt
 import numpy as np
 import decimal
+import functools
 import math
 import logging
+import threading
 
 
 def magspec(frames, NFFT):
@@ -11,10 +12,10 @@ def magspec(frames, NFFT):
     :param NFFT: the FFT length to use. If NFFT > frame_len, the frames are zero-padded.
     :returns: If frames is an NxD matrix, output will be Nx(NFFT/2+1). Each row will be the magnitude spectrum of the corresponding frame.
     """
-    if np.shape(frames)[1] > NFFT:
+    if np.shape(frames)[-1] > NFFT:
         logging.warn(
             'frame length (%d) is greater than FFT size (%d), frame will be truncated. Increase NFFT to avoid.',
-            np.shape(frames)[1], NFFT)
+            np.shape(frames)[-1], NFFT)
     complex_spec = np.fft.rfft(frames, NFFT)
     return np.absolute(complex_spec)
 
@@ -34,18 +35,18 @@ def rolling_window(a, window, step=1):
     # http://ellisvalentiner.com/post/2017-03-21-np-strides-trick
     shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
     strides = a.strides + (a.strides[-1],)
-    return np.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)[::step]
+    return np.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)[..., ::step, :]
 
 def framesig(sig, frame_len, frame_step, winfunc=lambda x: np.ones((x,)), stride_trick=True):
     """Frame a signal into overlapping frames.
-    :param sig: the audio signal to frame.
+    :param sig: the audio signal to frame. A 2D array is treated as a batch of signals, one per row.
     :param frame_len: length of each frame measured in samples.
     :param frame_step: number of samples after the start of the previous frame that the next frame should begin.
-    :param winfunc: the analysis window to apply to each frame. By default no window is applied.
+    :param winfunc: the analysis window to apply to each frame. By default no window is applied. None skips the window multiplication.
     :param stride_trick: use stride trick to compute the rolling window and window multiplication faster
-    :returns: an array of frames. Size is NUMFRAMES by frame_len.
+    :returns: an array of frames. Size is NUMFRAMES by frame_len, with the batch dimension leading for 2D input.
     """
-    slen = len(sig)
+    slen = np.shape(sig)[-1]
     frame_len = int(round_half_up(frame_len))
     frame_step = int(round_half_up(frame_step))
     if slen <= frame_len:
@@ -55,18 +56,20 @@ def framesig(sig, frame_len, frame_step, winfunc=lambda x: np.ones((x,)), stride
 
     padlen = int((numframes - 1) * frame_step + frame_len)
 
-    zeros = np.zeros((padlen - slen,))
-    padsignal = np.concatenate((sig, zeros))
+    zeros = np.zeros(np.shape(sig)[:-1] + (padlen - slen,))
+    padsignal = np.concatenate((sig, zeros), axis=-1)
     if stride_trick:
-        win = winfunc(frame_len)
+        win = None if winfunc is None else get_cached_window(winfunc, frame_len)
         frames = rolling_window(padsignal, window=frame_len, step=frame_step)
     else:
         indices = np.tile(np.arange(0, frame_len), (numframes, 1)) + numpy.tile(
             np.arange(0, numframes * frame_step, frame_step), (frame_len, 1)).T
         indices = np.array(indices, dtype=np.int32)
         frames = padsignal[indices]
-        win = np.tile(winfunc(frame_len), (numframes, 1))
+        win = None if winfunc is None else np.tile(winfunc(frame_len), (numframes, 1))
 
+    if win is None:
+        return frames
     return frames * win
 
 
@@ -76,7 +79,8 @@ def preemphasis(signal, coeff=0.95):
     :param coeff: The preemphasis coefficient. 0 is no filter, default is 0.95.
     :returns: the filtered signal.
     """
-    return np.append(signal[0], signal[1:] - coeff * signal[:-1])
+    return np.concatenate(
+        (signal[..., :1], signal[..., 1:] - coeff * signal[..., :-1]), axis=-1)
 
 def hz2mel(hz):
     """Convert a value in Hertz to Mels
@@ -113,20 +117,41 @@ def get_filterbanks(nfilt=20,nfft=512,samplerate=16000,lowfreq=0,highfreq=None):
     #  from Hz to fft bin number
     bin = np.floor((nfft+1)*mel2hz(melpoints)/samplerate)
 
-    fbank = np.zeros([nfilt,nfft//2+1])
-    for j in range(0,nfilt):
-        for i in range(int(bin[j]), int(bin[j+1])):
-            fbank[j,i] = (i - bin[j]) / (bin[j+1]-bin[j])
-        for i in range(int(bin[j+1]), int(bin[j+2])):
-            fbank[j,i] = (bin[j+2]-i) / (bin[j+2]-bin[j+1])
+    # rising and falling slopes of every triangular filter, evaluated on all fft bins at once
+    i = np.arange(nfft//2+1)[np.newaxis, :]
+    left, center, right = bin[:-2, np.newaxis], bin[1:-1, np.newaxis], bin[2:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = (i - left) / (center - left)
+        falling = (right - i) / (right - center)
+    fbank = np.where((i >= left) & (i < center), rising, 0.)
+    fbank = np.where((i >= center) & (i < right), falling, fbank)
     return fbank
 
 
+@functools.lru_cache(maxsize=32)
+def get_cached_filterbanks(nfilt=20,nfft=512,samplerate=16000,lowfreq=0,highfreq=None,dtype=np.float32):
+    """Memoized get_filterbanks. The filterbank is built once per parameter set and returned as a
+    read-only, C-contiguous array of the requested dtype; do not modify it in place.
+    :returns: A numpy array of size nfilt * (nfft/2 + 1) containing filterbank. Each row holds 1 filter.
+    """
+    fb = np.ascontiguousarray(get_filterbanks(nfilt,nfft,samplerate,lowfreq,highfreq), dtype=dtype)
+    fb.setflags(write=False)
+    return fb
+
+
+@functools.lru_cache(maxsize=32)
+def get_cached_window(winfunc, frame_len, dtype=np.float64):
+    """Memoized analysis window winfunc(frame_len) as a read-only array of the requested dtype."""
+    win = np.ascontiguousarray(winfunc(frame_len), dtype=dtype)
+    win.setflags(write=False)
+    return win
+
+
 def fbank(signal,samplerate=16000,winlen=0.025,winstep=0.01,
           nfilt=26,nfft=512,lowfreq=0,highfreq=None,preemph=0.97,
           winfunc=lambda x:np.ones((x,))):
     """Compute Mel-filterbank energy features from an audio signal.
-    :param signal: the audio signal from which to compute features. Should be an N*1 array
+    :param signal: the audio signal from which to compute features. Should be an N*1 array, or a 2D array holding one signal per row
     :param samplerate: the sample rate of the signal we are working with, in Hz.
     :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
     :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
@@ -143,10 +168,10 @@ def fbank(signal,samplerate=16000,winlen=0.025,winstep=0.01,
     signal = preemphasis(signal,preemph)
     frames = framesig(signal, winlen*samplerate, winstep*samplerate, winfunc)
     pspec = powspec(frames,nfft)
-    energy = np.sum(pspec,1) # this stores the total energy in each frame
+    energy = np.sum(pspec,-1) # this stores the total energy in each frame
     energy = np.where(energy == 0,np.finfo(float).eps,energy) # if energy is zero, we get problems with log
 
-    fb = get_filterbanks(nfilt,nfft,samplerate,lowfreq,highfreq)
+    fb = get_cached_filterbanks(nfilt,nfft,samplerate,lowfreq,highfreq,np.float64)
     feat = np.dot(pspec,fb.T) # compute the filterbank energies
     feat = np.where(feat == 0,np.finfo(float).eps,feat) # if feat is zero, we get problems with log
 
@@ -156,7 +181,7 @@ def logfbank(signal,samplerate=16000,winlen=0.025,winstep=0.01,
              nfilt=26,nfft=512,lowfreq=0,highfreq=None,preemph=0.97,
              winfunc=lambda x:np.ones((x,))):
     """Compute log Mel-filterbank energy features from an audio signal.
-    :param signal: the audio signal from which to compute features. Should be an N*1 array
+    :param signal: the audio signal from which to compute features. Should be an N*1 array, or a 2D array holding one signal per row
     :param samplerate: the sample rate of the signal we are working with, in Hz.
     :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
     :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
@@ -166,8 +191,237 @@ def logfbank(signal,samplerate=16000,winlen=0.025,winstep=0.01,
     :param highfreq: highest band edge of mel filters. In Hz, default is samplerate/2
     :param preemph: apply preemphasis filter with preemph as coefficient. 0 is no filter. Default is 0.97.
     :param winfunc: the analysis window to apply to each frame. By default no window is applied. You can use np window functions here e.g. winfunc=numpy.hamming
-    :returns: A np array of size (NUMFRAMES by nfilt) containing features. Each row holds 1 feature vector.
+    :returns: A np array of size (NUMFRAMES by nfilt) containing features. Each row holds 1 feature vector. 2D input gives a leading batch dimension.
     """
     feat,energy = fbank(signal,samplerate,winlen,winstep,nfilt,nfft,lowfreq,highfreq,preemph,winfunc)
     return np.log(feat)
 
+
+
+
+class LogfbankExtractor:
+    """Log Mel-filterbank feature extractor with precomputed state.
+
+    Computes the same features as logfbank, but the filterbank matrix and the analysis window are
+    built once at construction instead of on every call. A rectangular window (the default) is
+    skipped entirely rather than multiplied in.
+
+    With dtype=np.float32 the whole pipeline runs in single precision (complex64 FFT with numpy>=2),
+    the 1/NFFT power scaling is folded into the filterbank and framing, power spectrum and features
+    are written into buffers preallocated per input shape, with the log and zero clipping done in place.
+    The returned features then are only valid until the next call with the same input shape from the
+    same thread, every thread gets its own buffers so an extractor can be shared across threads.
+    """
+
+    def __init__(self, samplerate=16000, winlen=0.025, winstep=0.01,
+                 nfilt=26, nfft=512, lowfreq=0, highfreq=None, preemph=0.97,
+                 winfunc=None, dtype=np.float64):
+        """
+        :param samplerate: the sample rate of the signal we are working with, in Hz.
+        :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
+        :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
+        :param nfilt: the number of filters in the filterbank, default 26.
+        :param nfft: the FFT size. Default is 512.
+        :param lowfreq: lowest band edge of mel filters. In Hz, default is 0.
+        :param highfreq: highest band edge of mel filters. In Hz, default is samplerate/2
+        :param preemph: apply preemphasis filter with preemph as coefficient. 0 is no filter. Default is 0.97.
+        :param winfunc: the analysis window to apply to each frame. None (default) applies no window.
+        :param dtype: np.float64 (default) reproduces logfbank exactly, np.float32 enables the single precision pipeline.
+        """
+        assert np.dtype(dtype) in (np.float32, np.float64), "dtype should be np.float32 or np.float64"
+
+        self.samplerate = samplerate
+        self.nfilt = nfilt
+        self.nfft = nfft
+        self.preemph = preemph
+        self.dtype = np.dtype(dtype)
+        self.frame_len = int(round_half_up(winlen*samplerate))
+        self.frame_step = int(round_half_up(winstep*samplerate))
+
+        self._win = None if winfunc is None else get_cached_window(winfunc, self.frame_len, self.dtype)
+        self._fb_T = get_cached_filterbanks(
+            nfilt, nfft, samplerate, lowfreq, highfreq or samplerate/2, self.dtype).T
+
+        self._single_precision = self.dtype == np.float32
+        if self._single_precision:
+            self._scaled_fb_T = np.ascontiguousarray(self._fb_T / self.dtype.type(nfft))
+            self._eps = self.dtype.type(np.finfo(float).eps)
+            self._local = threading.local()
+
+    def _buffer(self, name, shape):
+        """Returns the calling thread's preallocated buffer for name and shape, creating it on first use."""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        key = (name, shape)
+        buf = buffers.get(key)
+        if buf is None:
+            if len(buffers) >= 32:
+                buffers.clear()
+            buf = buffers[key] = np.zeros(shape, dtype=self.dtype)
+        return buf
+
+    def frame(self, signal):
+        """Frames a signal (or a batch of signals, one per row) and applies the analysis window.
+        :returns: an array of frames. Size is NUMFRAMES by frame_len, with the batch dimension leading for 2D input.
+        """
+        if not self._single_precision:
+            frames = framesig(signal, self.frame_len, self.frame_step, winfunc=None)
+            if self._win is not None:
+                frames = frames * self._win
+            return frames
+
+        slen = np.shape(signal)[-1]
+        if slen <= self.frame_len:
+            numframes = 1
+        else:
+            numframes = 1 + int(math.ceil((1.0 * slen - self.frame_len) / self.frame_step))
+        padlen = (numframes - 1) * self.frame_step + self.frame_len
+
+        # the tail of the buffer is never written so it stays zero padded
+        padsignal = self._buffer("padsignal", np.shape(signal)[:-1] + (padlen,))
+        padsignal[..., :slen] = signal
+        frames = rolling_window(padsignal, window=self.frame_len, step=self.frame_step)
+        if self._win is not None:
+            frames = np.multiply(frames, self._win, out=self._buffer("frames", frames.shape))
+        return frames
+
+    def framesToFeatures(self, frames, out=None):
+        """Converts windowed frames to log Mel-filterbank features.
+        :param out: optional float array of size (NUMFRAMES by nfilt) the features are written into.
+        :returns: A np array of size (NUMFRAMES by nfilt) containing features.
+        """
+        if not self._single_precision:
+            feat = np.dot(powspec(frames, self.nfft), self._fb_T)
+            feat = np.where(feat == 0, np.finfo(float).eps, feat) # if feat is zero, we get problems with log
+            return np.log(feat, out=out, casting="same_kind")
+
+        complex_spec = np.fft.rfft(frames, self.nfft)
+        pspec = self._buffer("pspec", complex_spec.shape)
+        np.absolute(complex_spec, out=pspec, casting="same_kind")
+        np.square(pspec, out=pspec)
+
+        if out is not None and out.dtype == self.dtype:
+            feat = out
+        else:
+            feat = self._buffer("feat", frames.shape[:-1] + (self.nfilt,))
+        np.matmul(pspec, self._scaled_fb_T, out=feat)
+        np.maximum(feat, self._eps, out=feat) # if feat is zero, we get problems with log
+        return np.log(feat, out=feat if out is None else out, casting="same_kind")
+
+    def __call__(self, signal, out=None):
+        """Computes log Mel-filterbank features of a signal, or of a batch of signals one per row.
+        :param out: optional float array the features are written into, such as a bound model input.
+        :returns: A np array of size (NUMFRAMES by nfilt) containing features. 2D input gives a leading batch dimension.
+        """
+        if self.preemph:
+            signal = preemphasis(signal, self.preemph)
+        return self.framesToFeatures(self.frame(signal), out=out)
+
+
+class StreamingLogfbank:
+    """Compute log Mel-filterbank features of a sliding window incrementally.
+
+    A sliding window that moves by hop_len samples shares most of its frames with the previous window.
+    The log-mel frames computed for the previous window are kept in a frame buffer, on every hop the
+    buffer is shifted and only the frames touching newly arrived samples (plus the zero padded tail
+    frames) are computed. The output is identical to logfbank(window, preemph=0) on the full window.
+
+    Frames can only be reused when hop_len is a multiple of the frame step, otherwise every hop falls
+    back to a full computation.
+    """
+
+    def __init__(self, window_len, hop_len, extractor=None, feat_buffer=None, **extractor_kwargs):
+        """
+        :param window_len: length of the sliding window in samples.
+        :param hop_len: number of new samples arriving per hop.
+        :param extractor: LogfbankExtractor computing the frames, built from extractor_kwargs if not given.
+            Preemphasis is not supported as it couples neighbouring frames.
+        :param feat_buffer: optional float array of size (NUMFRAMES by nfilt) holding the frame buffer, such
+            as a bound model input, so features are never copied out. It must not be written by anyone else.
+        """
+        assert 0 < hop_len <= window_len, "hop_len should be between 1 and window_len"
+
+        if extractor is None:
+            extractor_kwargs.setdefault("preemph", 0)
+            extractor = LogfbankExtractor(**extractor_kwargs)
+        assert not extractor.preemph, "StreamingLogfbank doesnt support preemphasis"
+
+        self.extractor = extractor
+        self.window_len = window_len
+        self.hop_len = hop_len
+        self.frame_step = frame_step = extractor.frame_step
+        frame_len = extractor.frame_len
+
+        if window_len <= frame_len:
+            self.numframes = 1
+            full_frames = int(window_len == frame_len)
+        else:
+            self.numframes = 1 + int(math.ceil((1.0 * window_len - frame_len) / frame_step))
+            full_frames = 1 + (window_len - frame_len) // frame_step
+
+        if hop_len % frame_step == 0:
+            # frames of the previous window which stay fully inside the new window
+            self._reusable_frames = max(full_frames - hop_len // frame_step, 0)
+        else:
+            self._reusable_frames = 0
+
+        self._samples = np.zeros(window_len, dtype=extractor.dtype)
+        if feat_buffer is None:
+            feat_buffer = np.zeros((self.numframes, extractor.nfilt), dtype=extractor.dtype)
+        assert feat_buffer.shape == (self.numframes, extractor.nfilt), \
+            "feat_buffer should be of shape (NUMFRAMES, nfilt)"
+        self._feat = feat_buffer
+        self._primed = False
+
+    def _computeFrames(self, first_frame):
+        """Recomputes log-mel frames from first_frame till the end of the window."""
+        frames = self.extractor.frame(self._samples[first_frame * self.frame_step:])
+        self.extractor.framesToFeatures(frames, out=self._feat[first_frame:])
+
+    def reset(self, window=None):
+        """Discards the buffered frames, optionally restarting from a full window.
+        :param window: optional array of window_len samples to compute features for.
+        :returns: the features of window, when given.
+        """
+        self._primed = False
+        if window is None:
+            self._samples[:] = 0
+            return None
+
+        assert np.shape(window) == (self.window_len,), "window should hold window_len samples"
+        self._samples[:] = window
+        self._computeFrames(0)
+        self._primed = True
+        return self._feat
+
+    def push(self, chunk):
+        """Slides the window by one hop and returns the features of the new window.
+        :param chunk: array of hop_len newly arrived samples.
+        :returns: A np array of size (NUMFRAMES by nfilt). The array is reused, it is only valid until the next call.
+        """
+        assert np.shape(chunk) == (self.hop_len,), "chunk should hold hop_len samples"
+
+        self._samples[:-self.hop_len] = self._samples[self.hop_len:]
+        self._samples[-self.hop_len:] = chunk
+
+        if not self._primed:
+            self._computeFrames(0)
+            self._primed = True
+            return self._feat
+
+        keep = self._reusable_frames
+        if keep > 0:
+            shift = self.hop_len // self.frame_step
+            self._feat[:keep] = self._feat[shift:shift + keep]
+        self._computeFrames(keep)
+        return self._feat
+
+    def __call__(self, window):
+        """Computes features of a full window, reusing frames if it is the previous window moved by one hop.
+        :param window: array of window_len samples.
+        :returns: A np array of size (NUMFRAMES by nfilt). The array is reused, it is only valid until the next call.
+        """
+        if self._primed and np.array_equal(window[:-self.hop_len], self._samples[self.hop_len:]):
+            return self.push(window[-self.hop_len:])
+        return self.reset(window)
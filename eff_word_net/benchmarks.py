@@ -0,0 +1,665 @@
+"""
+Performance benchmarks, can be run directly in cli
+`python -m eff_word_net.benchmarks --help`
+"""
+
+import glob
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import typer
+
+from eff_word_net import samples_loc
+from eff_word_net.embedding_index import IVFEmbeddingIndex
+from eff_word_net.reference import (
+    ReferenceFormat,
+    compute_prototypes,
+    load_reference,
+    save_reference,
+)
+
+app = typer.Typer(help="Performance benchmarks for eff_word_net", no_args_is_help=True)
+
+
+@app.callback()
+def main():
+    """
+    Performance benchmarks for eff_word_net
+    """
+
+
+def _latency_stats(latencies: list) -> str:
+    latencies = np.array(latencies) * 1000
+    return (
+        f"mean {latencies.mean():.3f}ms "
+        f"p50 {np.percentile(latencies, 50):.3f}ms "
+        f"p99 {np.percentile(latencies, 99):.3f}ms"
+    )
+
+
+def _synthetic_references(
+    n_hotwords: int, refs_per_hotword: int, dim: int, spread: float, seed: int
+) -> tuple:
+    """
+    Unit norm reference embeddings scattered around one random center per
+    hotword, returns (centers, embeddings, group_starts)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_hotwords, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    embeddings = np.repeat(centers, refs_per_hotword, axis=0)
+    embeddings += spread * rng.standard_normal(embeddings.shape).astype(np.float32) / np.sqrt(dim)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    group_starts = np.arange(n_hotwords) * refs_per_hotword
+    return centers, embeddings, group_starts
+
+
+@app.command()
+def index(
+    n_hotwords: int = typer.Option(2000, help="Number of hotwords in the vocabulary"),
+    refs_per_hotword: int = typer.Option(8, help="Reference embeddings per hotword"),
+    dim: int = typer.Option(256, help="Embedding size"),
+    queries: int = typer.Option(500, help="Number of query embeddings"),
+    top_k: int = typer.Option(10, help="Candidates shortlisted by the index"),
+    probes: str = typer.Option("1,4,8,16", help="Comma separated n_probe values"),
+    spread: float = typer.Option(1.0, help="Noise of references around their hotword"),
+    seed: int = typer.Option(0),
+):
+    """
+    Recall and latency of IVFEmbeddingIndex against exact scoring on
+    synthetic embeddings, recall is the fraction of queries whose exact
+    best hotword is among the shortlisted candidates
+    """
+    centers, embeddings, group_starts = _synthetic_references(
+        n_hotwords, refs_per_hotword, dim, spread, seed
+    )
+    rng = np.random.default_rng(seed + 1)
+    targets = rng.integers(0, n_hotwords, queries)
+    query_vectors = centers[targets] + spread * rng.standard_normal(
+        (queries, dim)
+    ).astype(np.float32) / np.sqrt(dim)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    exact_best = []
+    latencies = []
+    for query in query_vectors:
+        start = perf_counter()
+        scores = np.maximum.reduceat(np.matmul(embeddings, query), group_starts)
+        exact_best.append(scores.argmax())
+        latencies.append(perf_counter() - start)
+    print(f"exact  ({embeddings.shape[0]} embeddings): {_latency_stats(latencies)}")
+
+    start = perf_counter()
+    ivf = IVFEmbeddingIndex(embeddings, group_starts, seed=seed)
+    print(f"index build: {perf_counter() - start:.2f}s, {ivf.centroids.shape[0]} lists")
+
+    for n_probe in [int(x) for x in probes.split(",")]:
+        hits = 0
+        latencies = []
+        for query, best in zip(query_vectors, exact_best):
+            start = perf_counter()
+            candidates = ivf.search(query, top_k, n_probe=n_probe)
+            latencies.append(perf_counter() - start)
+            hits += best in candidates
+        print(
+            f"n_probe {n_probe:3d}: recall@{top_k} {hits / queries:.3f} "
+            f"{_latency_stats(latencies)}"
+        )
+
+
+@app.command()
+def reference_load(
+    replicate: int = typer.Option(
+        1, help="Repeat every sample reference this many times to emulate a large library"
+    ),
+    repeats: int = typer.Option(5, help="Timed loads per format"),
+):
+    """
+    Startup cost of loading the bundled sample references as json, binary
+    float32 and binary float16 (memory-mapped) files
+    """
+    reference_files = sorted(glob.glob(os.path.join(samples_loc, "*_ref.json")))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        variants = {"json": [], "binary float32": [], "binary float16": []}
+        for reference_file in reference_files:
+            data = json.loads(open(reference_file).read())
+            embeddings = np.array(data["embeddings"], dtype=np.float32)
+            for i in range(replicate):
+                name = os.path.join(tmp_dir, f"{i}_{os.path.basename(reference_file)}")
+                for variant, reference_format, dtype in (
+                    ("json", ReferenceFormat.json, np.float32),
+                    ("binary float32", ReferenceFormat.binary, np.float32),
+                    ("binary float16", ReferenceFormat.binary, np.float16),
+                ):
+                    path = f"{name}.{variant.replace(' ', '_')}"
+                    save_reference(
+                        path,
+                        {"embeddings": embeddings},
+                        {"model_type": data["model_type"]},
+                        reference_format,
+                        dtype=dtype,
+                    )
+                    variants[variant].append(path)
+
+        for variant, paths in variants.items():
+            timings = []
+            for _ in range(repeats):
+                start = perf_counter()
+                for path in paths:
+                    np.asarray(load_reference(path)["embeddings"], dtype=np.float32)
+                timings.append(perf_counter() - start)
+            size = sum(os.path.getsize(path) for path in paths)
+            print(
+                f"{variant:15s}: {len(paths)} files {size / 1024:.0f}KiB "
+                f"load {min(timings) * 1000:.2f}ms"
+            )
+
+
+def _embed_hotword_folders(model, wakewords_dir: str, seed: int) -> dict:
+    """
+    Embeds the audio files of every hotword folder in wakewords_dir,
+    returns hotword to (N, embedding_size) embeddings mapping
+    """
+    from eff_word_net.generate_reference import list_audio_files, load_audio
+
+    random.seed(seed)  # fixPaddingIssues picks random crops
+    hotword_embeddings = {}
+    for folder in sorted(glob.glob(os.path.join(wakewords_dir, "*"))):
+        audio_files = sorted(list_audio_files(folder))
+        if len(audio_files) < 2:
+            continue
+        batch = np.stack(
+            [model.fixPaddingIssues(load_audio(f)) for f in audio_files]
+        ).astype(np.float32)
+        hotword_embeddings[os.path.basename(folder)] = model.audioToVectors(batch)
+    return hotword_embeddings
+
+
+@app.command()
+def prototypes(
+    wakewords_dir: str = typer.Option("wakewords", help="Directory of hotword folders"),
+    k: int = typer.Option(2, help="Prototypes per hotword"),
+    seed: int = typer.Option(0),
+):
+    """
+    Leave-one-out hotword identification on the bundled wakewords samples,
+    every sample is matched against all hotwords using their full
+    reference sets and using k prototypes, reporting the accuracy change
+    """
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+
+    model = Resnet50_Arc_loss()
+    hotword_embeddings = _embed_hotword_folders(model, wakewords_dir, seed)
+    hotwords = list(hotword_embeddings)
+    all_prototypes = {
+        h: compute_prototypes(e, k, seed=seed)["prototypes"]
+        for h, e in hotword_embeddings.items()
+    }
+
+    results = {"full": [], "prototypes": []}
+    for target, embeddings in hotword_embeddings.items():
+        for i in range(embeddings.shape[0]):
+            query = embeddings[i : i + 1]
+            held_out = np.delete(embeddings, i, axis=0)
+            references = {
+                "full": {**hotword_embeddings, target: held_out},
+                "prototypes": {
+                    **all_prototypes,
+                    target: compute_prototypes(held_out, k, seed=seed)["prototypes"],
+                },
+            }
+            for variant, refs in references.items():
+                scores = [model.scoreVector(query, refs[h]) for h in hotwords]
+                results[variant].append(hotwords[int(np.argmax(scores))] == target)
+
+    vector_counts = {
+        "full": np.mean([e.shape[0] for e in hotword_embeddings.values()]),
+        "prototypes": np.mean([p.shape[0] for p in all_prototypes.values()]),
+    }
+    for variant, correct in results.items():
+        print(
+            f"{variant:10s}: accuracy {np.mean(correct):.3f} over {len(correct)} samples, "
+            f"{vector_counts[variant]:.1f} vectors per hotword"
+        )
+    print(
+        f"accuracy change: {np.mean(results['prototypes']) - np.mean(results['full']):+.3f}"
+    )
+
+
+@app.command()
+def cascade(
+    wakewords_dir: str = typer.Option("wakewords", help="Directory of hotword folders"),
+    thresholds: str = typer.Option(
+        "0.5,0.6,0.7,0.8", help="Comma separated first stage thresholds"
+    ),
+    threshold: float = typer.Option(0.7, help="ResNet detection threshold"),
+    noise_windows: int = typer.Option(200, help="Background noise windows added"),
+    seed: int = typer.Option(0),
+):
+    """
+    Accuracy / CPU trade-off of the detection cascade on the bundled
+    wakewords samples. Every other hotword folder is registered, half of
+    its samples become references and half positive queries, the other
+    folders plus noise windows are negatives. For each first stage
+    threshold reports the positives reaching the model, the negatives
+    screened out, detection accuracy and false accepts against running
+    the model on every window, and the estimated compute per window
+    """
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+    from eff_word_net.cascade import TemplateScorer, compute_templates, pool_features
+    from eff_word_net.generate_reference import list_audio_files, load_audio
+
+    model = Resnet50_Arc_loss()
+    random.seed(seed)  # fixPaddingIssues picks random crops
+    rng = np.random.default_rng(seed)
+
+    folders = [
+        f
+        for f in sorted(glob.glob(os.path.join(wakewords_dir, "*")))
+        if len(list_audio_files(f)) >= 2
+    ]
+    registered, queries, labels = [], [], []
+    for i, folder in enumerate(folders):
+        windows = np.stack(
+            [model.fixPaddingIssues(load_audio(f)) for f in sorted(list_audio_files(folder))]
+        ).astype(np.float32)
+        if i % 2 == 0:
+            references = windows[::2]
+            registered.append(
+                (
+                    model.audioToVectors(references),
+                    compute_templates(model.compute_logfbank_features(references)),
+                )
+            )
+            windows = windows[1::2]
+        queries.append(windows)
+        labels += [len(registered) - 1 if i % 2 == 0 else -1] * windows.shape[0]
+
+    # background at random levels, negatives as well
+    noise = rng.standard_normal((noise_windows, model.window_frames))
+    noise *= 10 ** rng.uniform(-4, -1, (noise_windows, 1))
+    queries.append(noise.astype(np.float32))
+    labels += [-1] * noise_windows
+
+    queries = np.concatenate(queries)
+    labels = np.array(labels)
+    features = model.compute_logfbank_features(queries).astype(np.float32)
+    vectors = model.audioToVectors(queries)
+
+    model_scores = np.array(
+        [[model.scoreVector(v[np.newaxis], e) for e, _ in registered] for v in vectors]
+    )
+    detected = np.where(
+        model_scores.max(axis=1) >= threshold, model_scores.argmax(axis=1), -1
+    )
+
+    start = perf_counter()
+    for _ in range(50):
+        model.audioToVector(queries[0])
+    model_secs = (perf_counter() - start) / 50
+
+    positives = labels >= 0
+
+    def report(name, passed, stage_secs):
+        final = np.where(passed, detected, -1)
+        print(
+            f"{name:18s}: positives kept {passed[positives].mean():.3f} "
+            f"negatives screened {1 - passed[~positives].mean():.3f} "
+            f"accuracy {np.mean(final[positives] == labels[positives]):.3f} "
+            f"false accepts {np.mean(final[~positives] >= 0):.3f} "
+            f"{(stage_secs + passed.mean() * model_secs) * 1000:.3f}ms/window"
+        )
+
+    print(
+        f"{len(registered)} hotwords registered, {positives.sum()} positive "
+        f"and {(~positives).sum()} negative windows, model {model_secs * 1000:.2f}ms/window"
+    )
+    report("model only", np.ones(len(labels), dtype=bool), 0.0)
+    for first_stage_threshold in [float(x) for x in thresholds.split(",")]:
+        scorers = [TemplateScorer(t, first_stage_threshold) for _, t in registered]
+        passed = np.zeros(len(labels), dtype=bool)
+        start = perf_counter()
+        for i, window_features in enumerate(features):
+            descriptor = pool_features(window_features)
+            passed[i] = any([s.isCandidate(descriptor) for s in scorers])
+        stage_secs = (perf_counter() - start) / len(labels)
+        report(f"first stage {first_stage_threshold:.2f}", passed, stage_secs)
+
+
+def _profile_variant(use_quantized_model: bool, wakewords_dir: str, repeats: int) -> dict:
+    """
+    Runs in a fresh process so peak memory belongs to a single variant
+    """
+    import resource
+
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    model = Resnet50_Arc_loss(use_quantized_model=use_quantized_model)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    window = np.random.default_rng(0).standard_normal(model.window_frames).astype(np.float32)
+    latencies = []
+    for _ in range(repeats):
+        start = perf_counter()
+        model.audioToVector(window)
+        latencies.append(perf_counter() - start)
+
+    return {
+        "latency": latencies,
+        "rss_kib": rss_after - rss_before,
+        "embeddings": _embed_hotword_folders(model, wakewords_dir, seed=0),
+    }
+
+
+@app.command()
+def quantized(
+    wakewords_dir: str = typer.Option("wakewords", help="Directory of hotword folders"),
+    repeats: int = typer.Option(100, help="Timed single window inferences"),
+):
+    """
+    fp32 against int8 quantized Resnet50_Arc_loss: single window latency,
+    memory added by loading the model, agreement of the embeddings and
+    leave-one-out hotword identification accuracy on the wakewords samples
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = {}
+    for variant, use_quantized_model in (("fp32", False), ("int8", True)):
+        with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[variant] = executor.submit(
+                _profile_variant, use_quantized_model, wakewords_dir, repeats
+            ).result()
+
+    for variant, result in results.items():
+        hotword_embeddings = result["embeddings"]
+        hotwords = list(hotword_embeddings)
+        correct = []
+        for target, embeddings in hotword_embeddings.items():
+            for i in range(embeddings.shape[0]):
+                refs = {**hotword_embeddings, target: np.delete(embeddings, i, axis=0)}
+                scores = [np.max(refs[h] @ embeddings[i]) for h in hotwords]
+                correct.append(hotwords[int(np.argmax(scores))] == target)
+        print(
+            f"{variant}: {_latency_stats(result['latency'])} "
+            f"memory +{result['rss_kib'] / 1024:.1f}MiB "
+            f"accuracy {np.mean(correct):.3f} over {len(correct)} samples"
+        )
+
+    fp32 = np.concatenate(list(results["fp32"]["embeddings"].values()))
+    int8 = np.concatenate(list(results["int8"]["embeddings"].values()))
+    similarity = np.sum(fp32 * int8, axis=1) / (
+        np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1)
+    )
+    print(
+        f"fp32/int8 embedding cosine similarity: mean {similarity.mean():.4f} "
+        f"min {similarity.min():.4f}"
+    )
+    print(
+        f"latency speedup: "
+        f"{np.mean(results['fp32']['latency']) / np.mean(results['int8']['latency']):.2f}x"
+    )
+
+
+_STARTUP_PROBE = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import eff_word_net.engine
+from eff_word_net.audio_processing import Resnet50_Arc_loss
+imported = perf_counter()
+lazy_modules = [m for m in ("onnxruntime", "pyaudio") if m in sys.modules]
+model = Resnet50_Arc_loss(lazy=True)
+constructed = perf_counter()
+model.onnx_sess
+session = perf_counter()
+import numpy as np
+window = np.random.default_rng(0).standard_normal(model.window_frames).astype(np.float32)
+first = perf_counter()
+model.audioToVector(window)
+first_inference = perf_counter() - first
+steady = []
+for _ in range(10):
+    t = perf_counter()
+    model.audioToVector(window)
+    steady.append(perf_counter() - t)
+print(json.dumps({
+    "import": imported - start,
+    "construct": constructed - imported,
+    "session": session - constructed,
+    "first_inference": first_inference,
+    "steady_inference": sorted(steady)[len(steady) // 2],
+    "loaded_on_import": lazy_modules,
+}))
+"""
+
+
+@app.command()
+def startup(
+    repeats: int = typer.Option(5, help="Fresh interpreter runs, medians are reported"),
+):
+    """
+    Cold start cost in fresh interpreters: importing eff_word_net.engine,
+    constructing a lazy Resnet50_Arc_loss, creating the onnx session, and
+    the first against steady state inference latency
+    """
+    import subprocess
+    import sys
+
+    runs = [
+        json.loads(
+            subprocess.run(
+                [sys.executable, "-c", _STARTUP_PROBE],
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout.strip().splitlines()[-1]
+        )
+        for _ in range(repeats)
+    ]
+    for key in ("import", "construct", "session", "first_inference", "steady_inference"):
+        print(f"{key:17s}: {np.median([r[key] for r in runs]) * 1000:8.2f}ms")
+    print(f"heavy modules loaded by import: {runs[0]['loaded_on_import'] or 'none'}")
+
+
+@app.command()
+def pool(
+    windows: int = typer.Option(512, help="Number of 1.5 sec windows embedded"),
+    max_workers: int = typer.Option(
+        os.cpu_count(), help="Largest worker count benchmarked"
+    ),
+    intra_op_threads: int = typer.Option(1, help="onnxruntime threads per worker"),
+    batch_size: int = typer.Option(16, help="Windows per onnx run inside a worker"),
+):
+    """
+    Throughput of InferencePool with 1..max_workers processes against a
+    single in-process session
+    """
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+    from eff_word_net.inference_pool import InferencePool
+
+    batch = np.random.default_rng(0).standard_normal((windows, 24000)).astype(np.float32)
+
+    model = Resnet50_Arc_loss(max_batch_size=batch_size)
+    start = perf_counter()
+    model.audioToVectors(batch)
+    baseline = windows / (perf_counter() - start)
+    print(f"in-process session : {baseline:8.1f} windows/s")
+    del model
+
+    for n_workers in range(1, max_workers + 1):
+        with InferencePool(
+            n_workers=n_workers,
+            intra_op_num_threads=intra_op_threads,
+            max_batch_size=batch_size,
+        ) as inference_pool:
+            inference_pool.audioToVectors(batch[: n_workers * 2])  # starts workers
+            start = perf_counter()
+            inference_pool.audioToVectors(batch)
+            throughput = windows / (perf_counter() - start)
+        print(
+            f"{n_workers:3d} workers        : {throughput:8.1f} windows/s "
+            f"({throughput / baseline:.2f}x)"
+        )
+
+
+@app.command()
+def server(
+    streams: str = typer.Option("1,4,16,32", help="Comma separated stream counts"),
+    hop_secs: float = typer.Option(0.25, help="Window hop of every stream"),
+    duration: float = typer.Option(10.0, help="Seconds of load per stream count"),
+    max_batch_size: int = typer.Option(16),
+    max_wait_ms: float = typer.Option(10.0),
+):
+    """
+    Load generator for BatchingInferenceServer, every simulated stream
+    submits a window each hop_secs in real time, reports throughput and
+    submit to result latency for each stream count
+    """
+    import threading
+    import time
+
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+    from eff_word_net.server import BatchingInferenceServer
+
+    model = Resnet50_Arc_loss()
+    window = np.random.default_rng(0).standard_normal(24000).astype(np.float32)
+
+    for n_streams in [int(x) for x in streams.split(",")]:
+        latencies = []
+        lock = threading.Lock()
+
+        def record(submitted):
+            def done(_):
+                with lock:
+                    latencies.append(perf_counter() - submitted)
+
+            return done
+
+        def stream_load(inference_server, stop_at):
+            next_hop = perf_counter()
+            while perf_counter() < stop_at:
+                inference_server.submitFrame(window).add_done_callback(
+                    record(perf_counter())
+                )
+                next_hop += hop_secs
+                time.sleep(max(0, next_hop - perf_counter()))
+
+        with BatchingInferenceServer(
+            model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+        ) as inference_server:
+            stop_at = perf_counter() + duration
+            threads = [
+                threading.Thread(target=stream_load, args=(inference_server, stop_at))
+                for _ in range(n_streams)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        batches = max(inference_server.batches_run, 1)
+        print(
+            f"{n_streams:4d} streams: {len(latencies) / duration:8.1f} windows/s "
+            f"mean batch {inference_server.windows_run / batches:5.1f} "
+            f"{_latency_stats(latencies)}"
+        )
+
+
+def _tone_snr(resample, orig_rate: int, freqs: list, secs: float) -> float:
+    """
+    SNR in dB of resample(tones at orig_rate) against the same tones
+    sampled directly at 16000Hz, the exact band limited resampling
+    """
+    from eff_word_net import RATE
+
+    def tones(rate):
+        t = np.arange(int(secs * rate)) / rate
+        return sum(np.sin(2 * np.pi * f * t + i) for i, f in enumerate(freqs))
+
+    out = resample(tones(orig_rate))
+    expected = tones(RATE)[: out.shape[0]]
+    # filter warm up and tail dont count
+    margin = RATE // 4
+    error = out[margin:-margin] - expected[margin:-margin]
+    return 10 * np.log10(np.sum(expected[margin:-margin] ** 2) / (np.sum(error**2) + 1e-12))
+
+
+@app.command()
+def resample(
+    rates: str = typer.Option(
+        "8000,22050,32000,44100,48000", help="Comma separated input sample rates"
+    ),
+    secs: float = typer.Option(60.0, help="Seconds of audio resampled per rate"),
+    chunk_secs: float = typer.Option(0.125, help="Chunk size of the streaming run"),
+):
+    """
+    Throughput and quality of PolyphaseResampler against the linear
+    np.interp resampling it replaced, quality is the SNR of in band tones
+    and the rejection of a tone above 8kHz which would alias
+    """
+    from eff_word_net import RATE
+    from eff_word_net.resample import PolyphaseResampler, resample_audio
+
+    def interp(audio, orig_rate):
+        new_length = -(-audio.shape[0] * RATE // orig_rate)
+        return np.interp(
+            np.arange(new_length) / RATE, np.arange(audio.shape[0]) / orig_rate, audio
+        )
+
+    for orig_rate in [int(x) for x in rates.split(",")]:
+        audio = np.random.default_rng(0).standard_normal(int(secs * orig_rate))
+        audio = audio.astype(np.float32)
+
+        start = perf_counter()
+        resample_audio(audio, orig_rate)
+        whole = secs / (perf_counter() - start)
+
+        resampler = PolyphaseResampler(orig_rate)
+        chunk = int(chunk_secs * orig_rate)
+        start = perf_counter()
+        for i in range(0, audio.shape[0], chunk):
+            resampler.process(audio[i : i + chunk])
+        streaming = secs / (perf_counter() - start)
+
+        start = perf_counter()
+        interp(audio, orig_rate)
+        linear = secs / (perf_counter() - start)
+
+        passband = [440.0, 1900.0, 0.35 * min(orig_rate, RATE)]
+        line = (
+            f"{orig_rate:6d}Hz: whole {whole:7.0f}x realtime, "
+            f"streaming {streaming:7.0f}x, np.interp {linear:7.0f}x | SNR "
+            f"{_tone_snr(lambda x: resample_audio(x, orig_rate), orig_rate, passband, 2):5.1f}dB "
+            f"(np.interp {_tone_snr(lambda x: interp(x, orig_rate), orig_rate, passband, 2):5.1f}dB)"
+        )
+        if orig_rate > RATE:
+            # a tone between 8kHz and the input Nyquist should vanish
+            alias = RATE / 2 + 0.3 * (orig_rate - RATE) / 2
+            t = np.arange(2 * orig_rate) / orig_rate
+            tone = np.sin(2 * np.pi * alias * t)
+            margin = RATE // 4
+
+            def rejection(out):
+                rms = np.sqrt(np.mean(out[margin:-margin] ** 2))
+                return -20 * np.log10(rms / np.sqrt(0.5) + 1e-12)
+
+            line += (
+                f" | {alias:.0f}Hz rejection {rejection(resample_audio(tone, orig_rate)):5.1f}dB "
+                f"(np.interp {rejection(interp(tone, orig_rate)):5.1f}dB)"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,6 +1,7 @@
 from eff_word_net.streams import SimpleMicStream
+from eff_word_net.generate_reference import load_audio
+from eff_word_net.resample import resample_audio
 import pyaudio
-import librosa
 import numpy as np
 
 CHUNK = 1000
@@ -32,7 +33,7 @@ def record_audio():
 
 def playFrame(inpFrame):
     print(inpFrame)
-    converterFrame = librosa.resample(inpFrame, orig_sr=16000, target_sr=48000)
+    converterFrame = resample_audio(inpFrame, 16000, 48000)
     p = pyaudio.PyAudio()
     stream = p.open(
         format=pyaudio.paFloat32,
@@ -55,9 +56,8 @@ input("Press enter to record and wait for speak now:")
 frame = record_audio()
 input("Press Enter to play")
 playFrame(frame)
-frame = librosa.load(
-    "/home/captainamerica/Programming/EfficientWord-Net/EfficientWord-Net-Deployment/wakewords/alexa/alexa_en-GB_KateV3Voice.mp3",
-    sr=16000,
-)[0]
+frame = load_audio(
+    "/home/captainamerica/Programming/EfficientWord-Net/EfficientWord-Net-Deployment/wakewords/alexa/alexa_en-GB_KateV3Voice.mp3"
+)
 playFrame(frame)
 
@@ -0,0 +1,155 @@
+"""
+Approximate nearest neighbour search over reference embeddings, used to
+shortlist candidate hotwords when a MultiHotwordDetector holds a very large
+vocabulary. Implemented in numpy only
+"""
+
+import numpy as np
+
+
+def kmeans(
+    embeddings: np.array, k: int, n_iter: int = 20, seed: int = 0
+) -> tuple:
+    """
+    Spherical k-means (cosine similarity) over embeddings
+
+    Inp Parameters:
+
+        embeddings : np.array of shape (N, embedding_size)
+
+        k : number of clusters, clipped to N
+
+        n_iter : max number of assignment/update rounds
+
+        seed : seed of the initial centroid selection, same seed gives
+        the same clusters
+
+    Out Parameters:
+
+        (centroids, assignments) : unit norm centroids of shape
+        (k, embedding_size) and the cluster index of every embedding
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = embeddings.shape[0]
+    assert n > 0, "Atleast 1 embedding is required for clustering"
+    k = min(k, n)
+
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(n, size=k, replace=False)].copy()
+    assignments = np.full(n, -1)
+
+    for _ in range(n_iter):
+        similarity = np.matmul(embeddings, centroids.T)
+        new_assignments = similarity.argmax(axis=1)
+        if np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, embeddings)
+        counts = np.bincount(assignments, minlength=k)
+
+        # empty clusters are restarted on the worst represented points
+        empty = np.flatnonzero(counts == 0)
+        if empty.shape[0] > 0:
+            worst = np.argsort(similarity.max(axis=1))[: empty.shape[0]]
+            sums[empty] = embeddings[worst]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1, norms)
+
+    return centroids, assignments
+
+
+class IVFEmbeddingIndex:
+    """
+    Inverted file index over grouped embeddings (one group per hotword)
+
+    Embeddings are clustered into n_lists coarse cells, a query is only
+    compared with the embeddings of its n_probe most similar cells and the
+    best scoring groups among them are returned as candidates for exact
+    re-scoring
+    """
+
+    def __init__(
+        self,
+        embeddings: np.array,
+        group_starts: np.array,
+        n_lists: int = None,
+        n_probe: int = 8,
+        seed: int = 0,
+    ):
+        """
+        Inp Parameters:
+
+            embeddings : reference embeddings of all groups stacked along
+            the first axis
+
+            group_starts : sorted row index where each group begins
+
+            n_lists : number of coarse cells, defaults to sqrt(N)
+
+            n_probe : number of cells searched per query, higher values
+            trade latency for recall
+
+            seed : seed used for clustering
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n = embeddings.shape[0]
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+
+        self.n_groups = len(group_starts)
+        self.n_probe = n_probe
+
+        labels = np.zeros(n, dtype=np.int64)
+        labels[np.asarray(group_starts[1:], dtype=np.int64)] = 1
+        labels = np.cumsum(labels)
+
+        self.centroids, assignments = kmeans(embeddings, n_lists, seed=seed)
+
+        # embeddings are reordered so every cell is a contiguous slice
+        order = np.argsort(assignments, kind="stable")
+        self._vectors = np.ascontiguousarray(embeddings[order])
+        self._labels = labels[order]
+        counts = np.bincount(assignments, minlength=self.centroids.shape[0])
+        self._list_bounds = np.concatenate(([0], np.cumsum(counts)))
+
+    def search(self, inp_vector: np.array, k: int, n_probe: int = None) -> np.array:
+        """
+        Returns up to k candidate groups for the given embedding
+
+        Inp Parameters:
+
+            inp_vector : embedding of shape (1, embedding_size)
+
+            k : max number of groups returned
+
+            n_probe : overrides the number of cells searched
+
+        Out Parameters:
+
+            np.array of group indices, most similar first
+        """
+        inp_vector = np.asarray(inp_vector, dtype=np.float32).ravel()
+        n_probe = min(n_probe or self.n_probe, self.centroids.shape[0])
+
+        cells = np.argpartition(-np.matmul(self.centroids, inp_vector), n_probe - 1)[
+            :n_probe
+        ]
+        rows = np.concatenate(
+            [
+                np.arange(self._list_bounds[c], self._list_bounds[c + 1])
+                for c in cells
+            ]
+        )
+        if rows.shape[0] == 0:
+            return rows
+
+        similarity = np.matmul(self._vectors[rows], inp_vector)
+        group_scores = np.full(self.n_groups, -np.inf, dtype=np.float32)
+        np.maximum.at(group_scores, self._labels[rows], similarity)
+
+        found = np.flatnonzero(group_scores > -np.inf)
+        k = min(k, found.shape[0])
+        top = found[np.argpartition(-group_scores[found], k - 1)[:k]]
+        return top[np.argsort(-group_scores[top])]
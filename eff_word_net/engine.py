@@ -1,15 +1,18 @@
-import json
+from concurrent.futures import Executor
 from os.path import isfile, join
 import numpy as np
-import pyaudio
 
-from typing import Tuple, List, Union
+from typing import AsyncIterator, Callable, Tuple, List, Union
 
 from eff_word_net.audio_processing import (
     First_Iteration_Siamese,
     ModelRawBackend,
     Resnet50_Arc_loss,
 )
+from eff_word_net.cascade import TemplateScorer, pool_features
+from eff_word_net.embedding_index import IVFEmbeddingIndex
+from eff_word_net.reference import load_reference
+from eff_word_net.vad import VoiceActivityDetector
 from eff_word_net import RATE
 from time import time as current_time_in_sec
 import logging
@@ -17,6 +20,89 @@ import logging
 from eff_word_net.audio_processing import MODEL_TYPE_MAPPER
 
 
+async def _listenFrames(
+    stream,
+    model: ModelRawBackend,
+    score_frame: Callable,
+    is_match: Callable,
+    executor: Executor,
+    max_pending: int,
+) -> AsyncIterator:
+    """
+    Reads windows from an async stream into a bounded queue and scores them
+    on an executor, yielding the matching results. Reading pauses while
+    max_pending windows wait for inference, which propagates backpressure
+    to the stream source
+
+    Scoring holds model.inference_lock, the model keeps per call state
+    (streaming features, io binding buffers) so listeners sharing it on a
+    multi thread executor would otherwise race
+    """
+    # asyncio is only imported by async users, it is slow to import
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue(maxsize=max_pending)
+
+    def locked_score(frame):
+        with model.inference_lock:
+            return score_frame(frame)
+
+    async def produce():
+        try:
+            async for frame in stream:
+                # stream windows are reused buffers
+                await pending.put(np.array(frame))
+        except Exception as e:
+            await pending.put(e)
+            return
+        await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            frame = await pending.get()
+            if frame is None:
+                break
+            if isinstance(frame, Exception):
+                raise frame
+            result = await loop.run_in_executor(executor, locked_score, frame)
+            if is_match(result):
+                yield result
+    finally:
+        producer.cancel()
+
+
+def _gatedVector(
+    model: ModelRawBackend,
+    vad: VoiceActivityDetector,
+    inp_audio_frame: np.array,
+    first_stages: List[TemplateScorer] = None,
+) -> np.array:
+    """
+    Embeds a window unless vad finds no speech in it or none of the cascade
+    first_stages finds a candidate, returns None then
+    """
+    if vad is not None and not vad.uses_features:
+        if not vad.isSpeech(inp_audio_frame):
+            return None
+    if not first_stages and (vad is None or not vad.uses_features):
+        return model.audioToVector(inp_audio_frame)
+
+    # features are computed even for skipped windows, streaming feature
+    # extraction relies on seeing every window
+    features = model.compute_logfbank_features(inp_audio_frame)
+    if vad is not None and vad.uses_features:
+        if not vad.isSpeech(inp_audio_frame, features):
+            return None
+    if first_stages:
+        # every stage is scored so each keeps its own statistics
+        descriptor = pool_features(features)
+        if not any([stage.isCandidate(descriptor) for stage in first_stages]):
+            return None
+    return model.featuresToVector(features)
+
+
 class HotwordDetector:
     """
     EfficientWord based HotwordDetector Engine implementation class
@@ -31,6 +117,10 @@ class HotwordDetector:
         relaxation_time=0.8,
         continuous=True,
         verbose=False,
+        use_prototypes=True,
+        vad: VoiceActivityDetector = None,
+        first_stage_threshold: float = None,
+        clock: Callable[[], float] = None,
     ):
         """
         Intializes hotword detector instance
@@ -41,8 +131,8 @@ class HotwordDetector:
 
             model : model to be used
 
-            reference_file : path of reference file for a hotword generated
-            with efficientword.generate_reference module
+            reference_file : path of reference file (json or binary) for a
+            hotword generated with efficientword.generate_reference module
 
             threshold: float value between 0 and 1 , min similarity score
             required for a match
@@ -52,13 +142,35 @@ class HotwordDetector:
 
             continuous: bool value to know if a HotwordDetector is operating on a single continuous stream , else false
 
+            use_prototypes: score against the k-means prototypes stored in
+            the reference file (generate_reference --prototypes) instead of
+            every reference embedding, ignored if the file has none
+
+            vad: VoiceActivityDetector (EnergyVAD, SpectralVAD) deciding
+            which windows scoreFrame runs the model on, replaces the
+            default peak check on the first 1/10 sec. Give every detector
+            its own instance, the gate keeps state across windows
+
+            first_stage_threshold: enables the detection cascade, windows
+            whose pooled log-fbank features score below it against the
+            templates of the reference file (generate_reference
+            --templates) skip the model
+
+            clock: function returning the current time in seconds which
+            relaxation_time is measured with, wall clock time when None.
+            For streams running faster than realtime (FileAudioStream)
+            pass the stream timeline, lambda: stream.timeline_secs. Hotwords
+            right at the start of the timeline are detected, and a clock
+            going back (a restarted stream) clears the last activation
+
         """
         assert isfile(reference_file), "Reference File Path Invalid"
 
         assert threshold > 0 and threshold < 1, "Threshold can be only between 0 and 1"
 
-        data = json.loads(open(reference_file, "r").read())
-        self.embeddings = np.array(data["embeddings"]).astype(np.float32)
+        # the arrays are small, reading them keeps no file open per detector
+        data = load_reference(reference_file, mmap=False)
+        self.embeddings = np.asarray(data["embeddings"], dtype=np.float32)
 
         # self.model_type = data.get()
         assert self.embeddings.shape[0] > 3, (
@@ -68,6 +180,25 @@ class HotwordDetector:
         assert MODEL_TYPE_MAPPER[data["model_type"]] == type(model), (
             "reference file model doesnt match with inference time model"
         )
+
+        # files predating model variants were all generated with fp32
+        reference_variant = data.get("model_variant", "fp32")
+        if reference_variant != model.model_variant:
+            logging.warning(
+                f"{reference_file} was generated with the {reference_variant} "
+                f"model but {model.model_variant} is used for inference, "
+                "scores will be slightly off"
+            )
+
+        if use_prototypes and "prototypes" in data:
+            self.embeddings = np.asarray(data["prototypes"], dtype=np.float32)
+
+        self.first_stage = None
+        if first_stage_threshold is not None:
+            assert "templates" in data, (
+                "reference file has no first stage templates, regenerate it with --templates"
+            )
+            self.first_stage = TemplateScorer(data["templates"], first_stage_threshold)
         self.model = model
 
         self.hotword = hotword
@@ -76,20 +207,38 @@ class HotwordDetector:
 
         self.relaxation_time = relaxation_time
         self.verbose = verbose
+        self.vad = vad
+        self.clock = clock or current_time_in_sec
 
-        self.__last_activation_time = current_time_in_sec()
+        # a timeline starts with nothing to relax from, like scan_blocks
+        self.__last_activation_time = (
+            current_time_in_sec() if clock is None else -np.inf
+        )
 
     def __repr__(self):
         return f"Hotword: {self.hotword}"
 
+    def __now(self) -> float:
+        current_time = self.clock()
+        if current_time < self.__last_activation_time:
+            # the timeline restarted, activations of the previous run dont count
+            self.__last_activation_time = -np.inf
+        return current_time
+
     def __crossedRelaxationTime(self):
-        current_time = current_time_in_sec()
+        current_time = self.__now()
         print("gap :", current_time - self.__last_activation_time)
         return (current_time - self.__last_activation_time) > self.relaxation_time
 
     def scoreVector(self, inp_vec: np.array) -> float:
-        score = self.model.scoreVector(inp_vec, self.embeddings)
-        current_time = current_time_in_sec()
+        return self._relaxScore(self.model.scoreVector(inp_vec, self.embeddings))
+
+    def _relaxScore(self, score: float) -> float:
+        """
+        Applies relaxation_time to a raw similarity score and records the
+        activation, scores below threshold pass through untouched
+        """
+        current_time = self.__now()
 
         if self.continuous:
             if score > self.threshold:
@@ -116,7 +265,8 @@ class HotwordDetector:
             inp_audio_frame : np.array of 1channel 1 sec 16000Hz sampled audio
             frame
             unsafe : bool value, set to False by default to prevent engine
-            processing continuous speech or silence, to minimalize false positives
+            processing continuous speech or silence, to minimalize false positives,
+            True also bypasses vad
 
         **Note : change unsafe to True only if you know what you are doing**
 
@@ -127,10 +277,11 @@ class HotwordDetector:
                 "confidence":float value
             }
                  or
-            None when no voice activity is identified
+            None when no voice activity is identified or the cascade
+            first stage rejects the frame
         """
 
-        if not unsafe:
+        if not unsafe and self.vad is None:
             upperPoint = max((inp_audio_frame / inp_audio_frame.max())[: RATE // 10])
             if upperPoint > 0.2:
                 return None
@@ -138,10 +289,61 @@ class HotwordDetector:
         # assert inp_audio_frame.shape == (RATE,), \
         #    f"Audio frame needs to be a 1 sec {RATE}Hz sampled vector"
 
-        score = self.scoreVector(self.model.audioToVector(inp_audio_frame))
+        embedding = _gatedVector(
+            self.model,
+            None if unsafe else self.vad,
+            inp_audio_frame,
+            None if self.first_stage is None else [self.first_stage],
+        )
+        if embedding is None:
+            return None
+
+        score = self.scoreVector(embedding)
 
         return {"match": score >= self.threshold, "confidence": score}
 
+    def listen(
+        self,
+        stream,
+        unsafe: bool = False,
+        executor: Executor = None,
+        max_pending: int = 4,
+    ) -> AsyncIterator[dict]:
+        """
+        Async generator of matches found in an AsyncAudioStream, inference
+        runs on executor (the event loop default executor when None) so the
+        event loop is never blocked. Any number of listeners can run at
+        once, inference is serialized per model so detectors sharing a
+        model dont race on its state, give each a model of its own to use
+        several cores
+
+            async for result in detector.listen(stream):
+                print(result["confidence"])
+
+        Inp Parameters:
+
+            stream : AsyncAudioStream or any async iterable of windows
+
+            unsafe : passed on to scoreFrame
+
+            executor : concurrent.futures executor running inference
+
+            max_pending : windows read ahead of inference before reading
+            from the stream pauses
+
+        Out Parameters:
+
+            scoreFrame results with match True
+        """
+        return _listenFrames(
+            stream,
+            self.model,
+            lambda frame: self.scoreFrame(frame, unsafe=unsafe),
+            lambda result: result is not None and result["match"],
+            executor,
+            max_pending,
+        )
+
 
 HotwordDetectorArray = List[HotwordDetector]
 MatchInfo = Tuple[HotwordDetector, float]
@@ -159,11 +361,28 @@ class MultiHotwordDetector:
         detector_collection: HotwordDetectorArray,
         model: ModelRawBackend,
         continuous=True,
+        index_top_k: int = None,
+        index_probes: int = 8,
+        vad: VoiceActivityDetector = None,
     ):
         """
         Inp Parameters:
 
             detector_collection : List/Tuple of HotwordDetector instances
+
+            index_top_k : when given, an approximate nearest neighbour index
+            over all reference embeddings shortlists this many hotwords per
+            frame and only those are scored exactly, meant for vocabularies
+            of hundreds of hotwords or more
+
+            index_probes : number of index cells searched per frame, higher
+            values improve recall of the shortlist at the cost of latency
+
+            vad : VoiceActivityDetector gating model inference for all
+            hotwords at once, unless unsafe is passed
+
+        When every detector has a first_stage_threshold, frames no hotword
+        first stage accepts skip the model as well
         """
         assert len(detector_collection) > 1, "Pass atleast 2 HotwordDetector instances"
 
@@ -176,6 +395,73 @@ class MultiHotwordDetector:
 
         self.detector_collection = detector_collection
         self.continous = continuous
+        self.index_top_k = index_top_k
+        self.index_probes = index_probes
+        self.vad = vad
+
+        self.stackEmbeddings()
+
+    def stackEmbeddings(self):
+        """
+        Stacks reference embeddings of all detectors into one contiguous
+        matrix so every hotword is scored with a single matmul (and builds
+        the embedding index), call again if detector embeddings or
+        thresholds are changed after construction
+        """
+        self._embeddings = np.ascontiguousarray(
+            np.concatenate([d.embeddings for d in self.detector_collection]),
+            dtype=np.float32,
+        )
+        group_sizes = [d.embeddings.shape[0] for d in self.detector_collection]
+        self._group_starts = np.cumsum([0] + group_sizes[:-1])
+        self._thresholds = np.array(
+            [d.threshold for d in self.detector_collection], dtype=np.float32
+        )
+
+        # the cascade can only screen frames when every hotword has a
+        # first stage, otherwise hotwords without one would be missed
+        self._first_stages = [d.first_stage for d in self.detector_collection]
+        if any(stage is None for stage in self._first_stages):
+            self._first_stages = None
+
+        self._index = None
+        if self.index_top_k is not None:
+            self._index = IVFEmbeddingIndex(
+                self._embeddings, self._group_starts, n_probe=self.index_probes
+            )
+
+    def findVectorMatches(self, inp_vec: np.array) -> MatchInfoArray:
+        """
+        Scores an embedding against every hotword at once, or against the
+        hotwords shortlisted by the embedding index when index_top_k is set
+
+        Out Parameters:
+
+            [ (detector,score) ,... ] : detectors whose score reached
+            their threshold after relaxation_time is applied, in
+            detector_collection order
+        """
+        if self._index is not None:
+            candidates = np.sort(self._index.search(inp_vec, self.index_top_k))
+            scores = np.zeros(len(self.detector_collection), dtype=np.float32)
+            for i in candidates:
+                detector = self.detector_collection[i]
+                scores[i] = self.model.scoreVector(inp_vec, detector.embeddings)
+        else:
+            scores = self.model.scoreVectorGroups(
+                inp_vec, self._embeddings, self._group_starts
+            )
+
+        matches: MatchInfoArray = []
+        # relaxation is only stateful above threshold, so only the
+        # candidates need to go through their detector
+        for i in np.flatnonzero(scores >= self._thresholds):
+            detector = self.detector_collection[i]
+            score = detector._relaxScore(scores[i])
+            if score < detector.threshold:
+                continue
+            matches.append((detector, score))
+        return matches
 
     def findBestMatch(
         self, inp_audio_frame: np.array, unsafe: bool = False
@@ -212,17 +498,46 @@ class MultiHotwordDetector:
             if(upperPoint > 0.2):
                 return None , None
         """
-        embedding = self.model.audioToVector(inp_audio_frame)
+        embedding = _gatedVector(
+            self.model, None if unsafe else self.vad, inp_audio_frame, self._first_stages
+        )
+        if embedding is None:
+            return None, None
+
+        return self.findBestVectorMatch(embedding)
+
+    def listen(
+        self,
+        stream,
+        unsafe: bool = False,
+        executor: Executor = None,
+        max_pending: int = 4,
+    ) -> AsyncIterator[MatchInfo]:
+        """
+        Async generator of best matches found in an AsyncAudioStream, see
+        HotwordDetector.listen
 
-        best_match_detector: str = None
-        best_match_score: float = 0.0
+        Out Parameters:
 
-        for detector in self.detector_collection:
-            score = detector.scoreVector(embedding)
+            (detector,score) findBestMatch results which found a match
+        """
+        return _listenFrames(
+            stream,
+            self.model,
+            lambda frame: self.findBestMatch(frame, unsafe=unsafe),
+            lambda result: result[0] is not None,
+            executor,
+            max_pending,
+        )
 
-            if score < detector.threshold:
-                continue
+    def findBestVectorMatch(self, inp_vec: np.array) -> MatchInfo:
+        """
+        findBestMatch for an already computed embedding
+        """
+        best_match_detector: str = None
+        best_match_score: float = 0.0
 
+        for detector, score in self.findVectorMatches(inp_vec):
             if score > best_match_score:
                 best_match_score = score
                 best_match_detector = detector
@@ -247,38 +562,24 @@ class MultiHotwordDetector:
         Out Parameters:
 
             [ (detector,score) ,... ] : returns list of matched detectors
-            with respective scores
+            with respective scores, best match first
 
         """
         # assert inp_audio_frame.shape == (RATE,), \
         #    f"Audio frame needs to be a 1 sec {RATE}Hz sampled vector"
 
-        if self.continous and (not unsafe):
+        if self.continous and (not unsafe) and self.vad is None:
             upperPoint = max((inp_audio_frame / inp_audio_frame.max())[:1600])
             if upperPoint > 0.2 or upperPoint == 0:
                 return None, None
 
-        embedding = self.model.audioToVector(inp_audio_frame)
-
-        matches: MatchInfoArray = []
+        embedding = _gatedVector(
+            self.model, None if unsafe else self.vad, inp_audio_frame, self._first_stages
+        )
+        if embedding is None:
+            return None, None
 
-        best_match_score = 0.0
-        for detector in self.detector_collection:
-            score = detector.getMatchScoreVector(embedding)
-            print(detector, score, end="|")
-            if score < detector.threshold:
-                continue
-            if len(matches) > 0:
-                for i in range(len(matches)):
-                    if matches[i][1] > score:
-                        matches.insert(i, (detector, score))
-                        break
-                else:
-                    matches.append(i, (detector, score))
-            else:
-                matches.append((detector, score))
-        print()
-        return matches
+        return sorted(self.findVectorMatches(embedding), key=lambda x: x[1], reverse=True)
 
 
 if __name__ == "__main__":
@@ -288,7 +589,7 @@ if __name__ == "__main__":
 
     print(samples_loc)
 
-    base_model = Resnet50_Arc_loss()
+    base_model = Resnet50_Arc_loss(sliding_window_secs=0.75)
 
     mycroft_hw = HotwordDetector(
         hotword="mycroft",
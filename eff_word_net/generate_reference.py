@@ -4,21 +4,283 @@ Can be run directly in cli
 """
 
 import os, glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import json
 from eff_word_net.audio_processing import ModelType, MODEL_TYPE_MAPPER
+from eff_word_net.cascade import compute_templates
+from eff_word_net.inference_pool import InferencePool
+from eff_word_net.resample import resample_audio
+from eff_word_net.reference import (
+    ReferenceFormat,
+    BINARY_EXTENSION,
+    compute_prototypes,
+    save_reference,
+)
 
 import typer
 from rich.progress import track
 import soundfile as sf
 
 
+def list_audio_files(input_dir: str) -> list:
+    return [*glob.glob(input_dir + "/*.wav"), *glob.glob(input_dir + "/*.mp3")]
+
+
+def load_audio(audio_file: str) -> np.array:
+    """
+    Decodes an audio file to a mono 16kHz float32 signal
+    """
+    audio, sr = sf.read(audio_file, dtype="float32")
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sr != 16000:
+        audio = resample_audio(audio, sr, 16000)
+    return audio
+
+
+def decode_audio_files(audio_files: list, threads: int = None) -> list:
+    """
+    load_audio over a list of files on a thread pool, decoding and
+    resampling mostly run in native code which releases the GIL
+
+    Inp Parameters:
+
+        threads : decoding threads, defaults to ThreadPoolExecutor default
+    """
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(load_audio, audio_files))
+
+
+def file_digest(audio_file: str) -> str:
+    """
+    sha256 of the file content, identifies audio whose embedding is cached
+    """
+    digest = hashlib.sha256()
+    with open(audio_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings of audio files keyed by model, augmentation settings and
+    file content, persisted as a npz file so regenerating references only
+    embeds new or changed audio
+    """
+
+    def __init__(
+        self,
+        cache_file: str,
+        model_type: str,
+        model_variant: str,
+        variants: int = 1,
+        seed: int = 0,
+    ):
+        self.cache_file = cache_file
+        self._prefix = f"{model_type}.{model_variant}.{variants}x{seed}."
+        self._embeddings = {}
+        self._dirty = False
+        if cache_file is not None and os.path.isfile(cache_file):
+            with np.load(cache_file) as data:
+                self._embeddings = {key: data[key] for key in data.files}
+
+    def get(self, digest: str) -> np.array:
+        return self._embeddings.get(self._prefix + digest)
+
+    def put(self, digest: str, embedding: np.array):
+        self._embeddings[self._prefix + digest] = np.asarray(embedding, dtype=np.float32)
+        self._dirty = True
+
+    def save(self):
+        if self.cache_file is None or not self._dirty:
+            return
+        # np.savez appends .npz to names without it, write to a name
+        # which already has it and move it over the cache atomically
+        tmp_file = self.cache_file + ".tmp.npz"
+        np.savez(tmp_file, **self._embeddings)
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
+
+
+def embed_audio_files(
+    hotword_files: dict,
+    model,
+    embedder=None,
+    threads: int = None,
+    batch_size: int = 64,
+    cache: EmbeddingCache = None,
+    keep_windows: bool = False,
+    variants: int = 1,
+    seed: int = 0,
+) -> dict:
+    """
+    Embeds the sample files of several hotwords at once, decoding on a
+    thread pool and running the model on batches mixing all hotwords
+
+    Inp Parameters:
+
+        hotword_files : hotword name to list of audio files mapping
+
+        model : model whose fixPaddingIssues prepares the windows
+
+        embedder : object with an audioToVectors method (InferencePool),
+        defaults to model
+
+        threads : decoding threads
+
+        batch_size : windows per audioToVectors call
+
+        cache : EmbeddingCache, files whose content is cached are not
+        decoded nor embedded again
+
+        keep_windows : also return the windows of every file, files are
+        then always decoded
+
+        variants, seed : every file gives variants windows, see
+        ModelRawBackend.augmentedWindows, must match those of cache
+
+    Out Parameters:
+
+        hotword name to (embeddings of shape (N*variants, embedding_size),
+        windows of shape (N*variants, window_frames) or None) mapping
+    """
+    embedder = embedder or model
+    jobs = [(hotword, f) for hotword, files in hotword_files.items() for f in files]
+
+    digests = [None] * len(jobs)
+    if cache is not None:
+        with ThreadPoolExecutor(threads) as executor:
+            digests = list(executor.map(file_digest, [f for _, f in jobs]))
+
+    embeddings = [None if d is None else cache.get(d) for d in digests]
+    to_decode = [
+        i for i, e in enumerate(embeddings) if e is None or keep_windows
+    ]
+    windows = [None] * len(jobs)
+    for i, audio in zip(
+        to_decode, decode_audio_files([jobs[i][1] for i in to_decode], threads)
+    ):
+        windows[i] = model.augmentedWindows(audio, variants, seed)
+
+    # variants of all files are flattened into (file, variant) rows so
+    # batches mix files, and split back per file once embedded
+    rows = [(i, v) for i, e in enumerate(embeddings) if e is None for v in range(variants)]
+    pending = {}
+    for start in track(
+        range(0, len(rows), batch_size), description="Generating Embeddings.. "
+    ):
+        batch = rows[start : start + batch_size]
+        vectors = embedder.audioToVectors(np.stack([windows[i][v] for i, v in batch]))
+        for (i, v), vector in zip(batch, vectors):
+            pending.setdefault(i, [None] * variants)[v] = vector
+    for i, vectors in pending.items():
+        embeddings[i] = np.stack(vectors)
+        if cache is not None:
+            cache.put(digests[i], embeddings[i])
+    if cache is not None:
+        cache.save()
+
+    results = {}
+    for hotword in hotword_files:
+        indices = [i for i, (h, _) in enumerate(jobs) if h == hotword]
+        results[hotword] = (
+            np.concatenate([embeddings[i] for i in indices]),
+            np.concatenate([windows[i] for i in indices]) if keep_windows else None,
+        )
+    return results
+
+
+def write_reference_file(
+    output_dir: str,
+    wakeword: str,
+    model,
+    model_type: str,
+    embeddings: np.array,
+    windows: np.array = None,
+    output_format: ReferenceFormat = ReferenceFormat.json,
+    prototypes: int = 0,
+    debug: bool = False,
+) -> str:
+    """
+    Writes the reference file of a hotword, with prototypes when
+    prototypes is above 0 and first stage templates when windows are given
+
+    Out Parameters:
+
+        path of the written file
+    """
+    if debug:
+        distanceMatrix = []
+
+        for embedding in embeddings:
+            distanceMatrix.append(
+                np.sqrt(np.sum((embedding - embeddings) ** 2, axis=1))
+            )
+
+        temp = np.squeeze(distanceMatrix).astype(np.float16)
+        temp2 = temp.flatten()
+        print(np.std(temp2), np.mean(temp2))
+        print(temp)
+
+    arrays = {"embeddings": embeddings}
+    if prototypes > 0:
+        arrays.update(compute_prototypes(embeddings, prototypes))
+        print(
+            f"{wakeword}: {embeddings.shape[0]} embeddings compressed to "
+            f"{arrays['prototypes'].shape[0]} prototypes"
+        )
+    if windows is not None:
+        arrays["templates"] = compute_templates(
+            model.compute_logfbank_features(np.array(windows))
+        )
+
+    extension = ".json" if output_format == ReferenceFormat.json else BINARY_EXTENSION
+    reference_file = os.path.join(output_dir, f"{wakeword}_ref{extension}")
+    save_reference(
+        reference_file,
+        arrays,
+        {"model_type": model_type, "model_variant": model.model_variant},
+        output_format,
+    )
+    return reference_file
+
+
 def generate_reference_file(
     input_dir: str = typer.Option(...),
     output_dir: str = typer.Option(...),
-    wakeword: str = typer.Option(...),
+    wakeword: str = typer.Option(
+        None, help="Name of the wakeword, not used with --bulk"
+    ),
     model_type: ModelType = typer.Option(..., case_sensitive=False),
     debug: bool = typer.Option(False),
+    output_format: ReferenceFormat = typer.Option(
+        ReferenceFormat.json, case_sensitive=False
+    ),
+    prototypes: int = typer.Option(
+        0, help="Also store at most this many k-means prototypes, 0 to skip"
+    ),
+    workers: int = typer.Option(
+        1, help="Inference worker processes, 0 to use every CPU core"
+    ),
+    templates: bool = typer.Option(
+        False, help="Also store log-fbank templates for the detection cascade"
+    ),
+    quantized: bool = typer.Option(False, help="Use the int8 quantized model"),
+    bulk: bool = typer.Option(
+        False,
+        help="input_dir holds one folder of samples per hotword, named after it",
+    ),
+    threads: int = typer.Option(0, help="Audio decoding threads, 0 for default"),
+    batch_size: int = typer.Option(64, help="Windows embedded per model call"),
+    cache_file: str = typer.Option(
+        None, help="npz file caching embeddings of unchanged audio files"
+    ),
+    variants: int = typer.Option(
+        1, help="Windows per sample, cropped/shifted and gain changed"
+    ),
+    seed: int = typer.Option(0, help="Seed of the crop, shift and gain choices"),
 ):
     """
     Generates reference files for few shot learning comparison
@@ -26,7 +288,7 @@ def generate_reference_file(
     Inp Parameters:
 
         input_dir : directory which holds only sample audio files
-        of wakeword
+        of wakeword, or with bulk a directory of such folders
 
         output_dir: directory where generated reference file will
         be stored
@@ -36,59 +298,103 @@ def generate_reference_file(
         model_type: type of the model to be used
 
         debug: self explanatory
+
+        output_format: json (default) or binary, binary reference files
+        are smaller and load faster
+
+        prototypes: when above 0, the embeddings are also compressed into
+        that many k-means prototypes which HotwordDetector scores instead
+        of the full set
+
+        workers: when not 1, embeddings are computed on an InferencePool
+        of that many processes (0 for cpu count)
+
+        templates: also store pooled log-fbank templates of the samples,
+        needed by HotwordDetector first_stage_threshold
+
+        quantized: embed with the int8 quantized model, the variant is
+        recorded in the reference file
+
+        bulk: write one reference file per sub folder of input_dir, all
+        hotwords are embedded in shared batches
+
+        threads: audio files are decoded on a pool of that many threads
+
+        batch_size: windows per model call
+
+        cache_file: embeddings are looked up and stored by file content in
+        it, so unchanged audio files are not embedded again
+
+        variants: every sample contributes that many reference embeddings
+        from windows placed at different seeded positions, all but the
+        first with a random gain within +-6dB
+
+        seed: reference files are reproducible for a given seed
     Out Parameters:
 
         None
 
     """
     # print(model_type)
-    model = MODEL_TYPE_MAPPER[model_type.value]()
+    model = MODEL_TYPE_MAPPER[model_type.value](use_quantized_model=quantized)
 
     assert os.path.isdir(input_dir)
     assert os.path.isdir(output_dir)
-    embeddings = []
 
-    audio_files = [*glob.glob(input_dir + "/*.wav"), *glob.glob(input_dir + "/*.mp3")]
+    if bulk:
+        hotword_files = {
+            os.path.basename(folder): list_audio_files(folder)
+            for folder in sorted(glob.glob(os.path.join(input_dir, "*")))
+            if os.path.isdir(folder) and len(list_audio_files(folder)) > 0
+        }
+        assert len(hotword_files) > 0, "no hotword folder with wav or mp3 files found"
+    else:
+        assert wakeword, "wakeword is required without --bulk"
+        hotword_files = {wakeword: list_audio_files(input_dir)}
 
-    assert len(audio_files) > 0, (
+    assert all(len(files) > 0 for files in hotword_files.values()), (
         "only wav and mp3 files are supported!!!! no wav or mp3 file is found. Ensure files are 16kHz mono WAV; convert non-WAV formats at https://ffmpegwasm.netlify.app/playground."
     )
 
-    for audio_file in track(audio_files, description="Generating Embeddings.. "):
-        audio, sr = sf.read(audio_file, dtype="float32")
-        if audio.ndim > 1:
-            audio = audio.mean(axis=1)
-        if sr != 16000:
-            # Resample using linear interpolation
-            old_times = np.arange(len(audio)) / sr
-            new_length = int(len(audio) * 16000 / sr)
-            new_times = np.arange(new_length) / 16000
-            audio = np.interp(new_times, old_times, audio)
-        embeddings.append(model.audioToVector(model.fixPaddingIssues(audio)))
-
-    embeddings = np.squeeze(np.array(embeddings))
-
-    if debug:
-        distanceMatrix = []
-
-        for embedding in embeddings:
-            distanceMatrix.append(
-                np.sqrt(np.sum((embedding - embeddings) ** 2, axis=1))
-            )
+    cache = None
+    if cache_file is not None:
+        cache = EmbeddingCache(
+            cache_file, model_type.value, model.model_variant, variants, seed
+        )
 
-        temp = np.squeeze(distanceMatrix).astype(np.float16)
-        temp2 = temp.flatten()
-        print(np.std(temp2), np.mean(temp2))
-        print(temp)
+    pool = None
+    if workers != 1:
+        pool = InferencePool(n_workers=workers or None, use_quantized_model=quantized)
+    try:
+        results = embed_audio_files(
+            hotword_files,
+            model,
+            embedder=pool,
+            threads=threads or None,
+            batch_size=batch_size,
+            cache=cache,
+            keep_windows=templates,
+            variants=variants,
+            seed=seed,
+        )
+    finally:
+        if pool is not None:
+            pool.close()
 
-    open(os.path.join(output_dir, f"{wakeword}_ref.json"), "w").write(
-        json.dumps(
-            {
-                "embeddings": embeddings.astype(float).tolist(),
-                "model_type": model_type.value,
-            }
+    for hotword, (embeddings, windows) in results.items():
+        reference_file = write_reference_file(
+            output_dir,
+            hotword,
+            model,
+            model_type.value,
+            embeddings,
+            windows,
+            output_format,
+            prototypes,
+            debug,
         )
-    )
+        if bulk:
+            print(f"{hotword}: {embeddings.shape[0]} embeddings -> {reference_file}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""
+Multi process inference for bulk embedding, every worker process holds its
+own onnx session with a small thread pool, windows are handed to the
+workers through shared memory instead of being pickled
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from eff_word_net import RATE
+
+_worker_model = None
+_worker_buffers = {}
+
+
+def _init_worker(model_kwargs: dict):
+    global _worker_model
+    from eff_word_net.audio_processing import Resnet50_Arc_loss
+
+    _worker_model = Resnet50_Arc_loss(**model_kwargs)
+
+
+def _embed_shared(
+    shm_name: str, shape: tuple, dtype: str, start: int, stop: int
+) -> np.array:
+    shm = _worker_buffers.get(shm_name)
+    if shm is None:
+        # the pool replaced its buffer, drop the stale attachment
+        for stale in _worker_buffers.values():
+            stale.close()
+        _worker_buffers.clear()
+        shm = _worker_buffers[shm_name] = shared_memory.SharedMemory(name=shm_name)
+
+    windows = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    vectors = _worker_model.audioToVectors(windows[start:stop])
+    del windows
+    return vectors
+
+
+class InferencePool:
+    """
+    Process pool running Resnet50_Arc_loss.audioToVectors across CPU cores
+
+    Exposes the same audioToVectors API as the model so it can be passed
+    wherever only embedding is needed (scan, reference generation)
+    """
+
+    def __init__(
+        self,
+        n_workers: int = None,
+        intra_op_num_threads: int = 1,
+        inter_op_num_threads: int = 1,
+        max_batch_size: int = 32,
+        **model_kwargs,
+    ):
+        """
+        Inp Parameters:
+
+            n_workers : number of worker processes, defaults to cpu count
+
+            intra_op_num_threads, inter_op_num_threads : onnxruntime thread
+            pool sizes of every worker session
+
+            max_batch_size : windows per onnx run inside a worker
+
+            model_kwargs : passed on to Resnet50_Arc_loss in every worker
+        """
+        self.n_workers = n_workers or os.cpu_count()
+        self.window_frames = int(1.5 * RATE)  # Resnet50_Arc_loss window
+        # enough windows to keep every worker busy with one full batch
+        self.max_batch_size = max_batch_size * self.n_workers
+
+        model_kwargs.update(
+            max_batch_size=max_batch_size,
+            intra_op_num_threads=intra_op_num_threads,
+            inter_op_num_threads=inter_op_num_threads,
+        )
+        # spawn avoids forking a parent which already runs onnxruntime threads
+        self._executor = ProcessPoolExecutor(
+            self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_kwargs,),
+        )
+        self._shm = None
+
+    def _sharedBuffer(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._shm.size < nbytes:
+            self._releaseBuffer()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return self._shm
+
+    def _releaseBuffer(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def audioToVectors(self, inpAudioBatch: np.array, max_batch_size=None) -> np.array:
+        """
+        Converts a batch of 1.5 sec windows to embeddings on the worker
+        processes, embeddings are returned in input order
+
+        Inp Parameters:
+
+            inpAudioBatch : np.array of shape (N, 24000)
+
+            max_batch_size : unused, accepted for compatibility with the
+            model API
+
+        Out Parameters:
+
+            np.array of shape (N, embedding_size)
+        """
+        assert inpAudioBatch.ndim == 2 and inpAudioBatch.shape[1] == self.window_frames, (
+            f"Audio batch needs to be of shape (N, {self.window_frames})"
+        )
+        assert inpAudioBatch.shape[0] > 0, "Empty audio batch received"
+
+        shm = self._sharedBuffer(inpAudioBatch.nbytes)
+        shared = np.ndarray(inpAudioBatch.shape, dtype=inpAudioBatch.dtype, buffer=shm.buf)
+        shared[:] = inpAudioBatch
+        del shared
+
+        n = inpAudioBatch.shape[0]
+        bounds = np.linspace(0, n, min(self.n_workers, n) + 1).astype(int)
+        futures = [
+            self._executor.submit(
+                _embed_shared,
+                shm.name,
+                inpAudioBatch.shape,
+                inpAudioBatch.dtype.str,
+                int(start),
+                int(stop),
+            )
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        return np.concatenate([f.result() for f in futures], axis=0)
+
+    def close(self):
+        self._executor.shutdown()
+        self._releaseBuffer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
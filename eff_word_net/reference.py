@@ -0,0 +1,263 @@
+"""
+Reading and writing of hotword reference files
+
+Besides the original json format, references can be stored in a compact
+binary format: an 8 byte magic, a little endian uint32 header length, a json
+header and raw little endian array blocks aligned to 64 bytes. The arrays
+can be memory-mapped, so loading a large library of wakewords doesnt parse
+or copy the embeddings
+
+Can be run directly in cli to convert json reference files
+`python -m eff_word_net.reference`
+"""
+
+import glob
+import json
+import os
+import struct
+from enum import Enum
+
+import numpy as np
+
+from eff_word_net.embedding_index import kmeans
+
+BINARY_MAGIC = b"EWNREF01"
+BINARY_EXTENSION = ".bin"
+_ALIGNMENT = 64
+
+
+class ReferenceFormat(str, Enum):
+    json = "json"
+    binary = "binary"
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def is_binary_reference(reference_file: str) -> bool:
+    with open(reference_file, "rb") as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def save_reference(
+    reference_file: str,
+    arrays: dict,
+    metadata: dict,
+    reference_format: ReferenceFormat = ReferenceFormat.json,
+    dtype=np.float32,
+):
+    """
+    Writes a reference file
+
+    Inp Parameters:
+
+        reference_file : output path
+
+        arrays : name to np.array mapping, must hold "embeddings"
+
+        metadata : json serializable values stored along the arrays,
+        must hold "model_type"
+
+        reference_format : json or binary
+
+        dtype : storage dtype of float arrays in binary files, np.float16
+        halves the file size
+    """
+    assert "embeddings" in arrays, "Reference file requires embeddings"
+    assert "model_type" in metadata, "Reference file requires model_type"
+
+    if ReferenceFormat(reference_format) == ReferenceFormat.json:
+        data = {name: np.asarray(arr).astype(float).tolist() for name, arr in arrays.items()}
+        data.update(metadata)
+        open(reference_file, "w").write(json.dumps(data))
+        return
+
+    blocks = []
+    header = dict(metadata)
+    header["arrays"] = {}
+    for name, arr in arrays.items():
+        arr = np.asarray(arr)
+        if np.issubdtype(arr.dtype, np.floating):
+            arr = arr.astype(dtype)
+        arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+        header["arrays"][name] = {
+            "dtype": arr.dtype.str,
+            "shape": list(arr.shape),
+        }
+        blocks.append((name, arr))
+
+    # offsets depend on the header length, which depends on the offsets,
+    # so the header is sized with placeholder offsets first
+    for name, _ in blocks:
+        header["arrays"][name]["offset"] = 10**12
+    header_len = len(json.dumps(header).encode())
+    offset = _align(len(BINARY_MAGIC) + 4 + header_len)
+    for name, arr in blocks:
+        header["arrays"][name]["offset"] = offset
+        offset = _align(offset + arr.nbytes)
+
+    header_bytes = json.dumps(header).encode().ljust(header_len)
+    with open(reference_file, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in blocks:
+            f.seek(header["arrays"][name]["offset"])
+            f.write(arr.tobytes())
+
+
+def load_reference(reference_file: str, mmap: bool = True) -> dict:
+    """
+    Reads a json or binary reference file, the format is detected from
+    the file content
+
+    Inp Parameters:
+
+        reference_file : path of the reference file
+
+        mmap : memory-map arrays of binary files instead of reading them,
+        the file is mapped once and the arrays are views into that map, so
+        it stays open (1 file descriptor) as long as any of them is alive
+
+    Out Parameters:
+
+        dict holding the stored metadata and arrays, arrays of json files
+        are float32 np.arrays
+    """
+    if not is_binary_reference(reference_file):
+        data = json.loads(open(reference_file, "r").read())
+        data["embeddings"] = np.array(data["embeddings"]).astype(np.float32)
+        return data
+
+    with open(reference_file, "rb") as f:
+        f.seek(len(BINARY_MAGIC))
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len).decode())
+
+        data = {k: v for k, v in header.items() if k != "arrays"}
+        mapped = None
+        for name, info in header["arrays"].items():
+            shape = tuple(info["shape"])
+            count = int(np.prod(shape))
+            if mmap and count > 0:
+                if mapped is None:
+                    mapped = np.memmap(reference_file, dtype=np.uint8, mode="r")
+                nbytes = count * np.dtype(info["dtype"]).itemsize
+                data[name] = (
+                    mapped[info["offset"] : info["offset"] + nbytes]
+                    .view(info["dtype"])
+                    .reshape(shape)
+                )
+            else:
+                f.seek(info["offset"])
+                data[name] = np.fromfile(f, dtype=info["dtype"], count=count).reshape(shape)
+    return data
+
+
+def compute_prototypes(embeddings: np.array, k: int, seed: int = 0) -> dict:
+    """
+    Compresses reference embeddings into at most k prototypes with
+    spherical k-means, so a detector scores k vectors per frame instead of
+    every reference embedding
+
+    Out Parameters:
+
+        {
+            "prototypes": unit norm centroids,
+            "prototype_counts": number of embeddings each prototype stands for,
+            "prototype_similarity": mean cosine similarity of those embeddings
+            to their prototype
+        }
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    centroids, assignments = kmeans(embeddings, k, seed=seed)
+
+    counts = np.bincount(assignments, minlength=centroids.shape[0])
+    similarity = np.sum(embeddings * centroids[assignments], axis=1)
+    mean_similarity = np.bincount(
+        assignments, weights=similarity, minlength=centroids.shape[0]
+    ) / np.maximum(counts, 1)
+
+    used = counts > 0
+    return {
+        "prototypes": centroids[used],
+        "prototype_counts": counts[used],
+        "prototype_similarity": mean_similarity[used],
+    }
+
+
+def convert_reference_files(
+    input_path: str, output_dir: str, half_precision: bool = False
+):
+    """
+    Converts json reference files to the binary reference format, the
+    output files keep the input name with a .bin extension
+
+    Inp Parameters:
+
+        input_path : json reference file or directory of *_ref.json files
+
+        output_dir : directory for the converted files
+
+        half_precision : store embeddings as float16 instead of float32
+    """
+    if os.path.isdir(input_path):
+        reference_files = sorted(glob.glob(os.path.join(input_path, "*_ref.json")))
+    else:
+        reference_files = [input_path]
+
+    assert len(reference_files) > 0, "no reference file found"
+    assert os.path.isdir(output_dir)
+
+    for reference_file in reference_files:
+        data = load_reference(reference_file)
+        arrays = {
+            name: np.asarray(value)
+            for name, value in data.items()
+            if isinstance(value, (list, np.ndarray)) and name != "embeddings"
+        }
+        arrays["embeddings"] = data["embeddings"]
+        metadata = {k: v for k, v in data.items() if k not in arrays}
+
+        output_file = os.path.join(
+            output_dir,
+            os.path.splitext(os.path.basename(reference_file))[0] + BINARY_EXTENSION,
+        )
+        save_reference(
+            output_file,
+            arrays,
+            metadata,
+            ReferenceFormat.binary,
+            dtype=np.float16 if half_precision else np.float32,
+        )
+        print(
+            f"{reference_file} ({os.path.getsize(reference_file)} bytes) -> "
+            f"{output_file} ({os.path.getsize(output_file)} bytes)"
+        )
+
+
+def _convert_reference_files_cli():
+    # typer is only imported for the cli, engine imports this module
+    import typer
+
+    def convert(
+        input_path: str = typer.Option(
+            ..., help="json reference file or directory of *_ref.json files"
+        ),
+        output_dir: str = typer.Option(..., help="directory for the converted files"),
+        half_precision: bool = typer.Option(
+            False, help="store embeddings as float16 instead of float32"
+        ),
+    ):
+        """
+        Converts json reference files to the binary reference format, the
+        output files keep the input name with a .bin extension
+        """
+        convert_reference_files(input_path, output_dir, half_precision)
+
+    typer.run(convert)
+
+
+if __name__ == "__main__":
+    _convert_reference_files_cli()
@@ -0,0 +1,175 @@
+"""
+Polyphase resampling of audio to the 16000Hz rate of the models, numpy
+only and stateful across chunks so it can run on live streams
+"""
+
+from math import gcd
+
+import numpy as np
+
+from eff_word_net import RATE
+
+
+class PolyphaseResampler:
+    """
+    Rational rate resampler, output sample n is a Kaiser windowed sinc
+    interpolation of the input around time n * orig_rate / target_rate.
+    The filter is split into one set of taps per output phase, so every
+    output costs a single dot product over the neighbouring input samples
+
+    Chunks of any size are fed with process, the output of a stream cut
+    into chunks is the same as that of the whole stream. Outputs lag the
+    input by half the filter length, flush returns the remaining tail once
+    the stream ends
+    """
+
+    def __init__(
+        self,
+        orig_rate: int,
+        target_rate: int = RATE,
+        zero_crossings: int = 16,
+        rolloff: float = 0.94,
+        kaiser_beta: float = 8.6,
+        dtype=np.float32,
+    ):
+        """
+        Inp Parameters:
+
+            orig_rate : sample rate of the input audio
+
+            target_rate : sample rate of the output audio
+
+            zero_crossings : sinc zero crossings on each side of the
+            filter, more gives a sharper cutoff at a higher cost
+
+            rolloff : cutoff as a fraction of the lower of both Nyquist
+            frequencies, below 1 so the transition band stays unaliased
+
+            kaiser_beta : Kaiser window shape, higher trades a wider
+            transition band for more stopband attenuation
+
+            dtype : dtype of the output audio
+        """
+        assert orig_rate > 0 and target_rate > 0, "sample rates should be positive"
+        assert 0 < rolloff <= 1, "rolloff should be between 0 and 1"
+
+        common = gcd(int(orig_rate), int(target_rate))
+        self.orig_rate = int(orig_rate)
+        self.target_rate = int(target_rate)
+        self.up = self.target_rate // common
+        self.down = self.orig_rate // common
+        self.dtype = dtype
+
+        # cutoff in cycles per input sample over the input Nyquist
+        cutoff = min(1.0, self.up / self.down) * rolloff
+        self.half_taps = int(np.ceil(zero_crossings / cutoff))
+
+        # t is the distance in input samples from output n (phase p) to
+        # the input j taps of its window
+        phases = np.arange(self.up)[:, np.newaxis] / self.up
+        t = phases + self.half_taps - 1 - np.arange(2 * self.half_taps)
+        window = np.i0(kaiser_beta * np.sqrt(np.clip(1 - (t / self.half_taps) ** 2, 0, 1)))
+        taps = np.sinc(cutoff * t) * window / np.i0(kaiser_beta)
+        # unit DC gain on every phase
+        self.taps = (taps / taps.sum(axis=1, keepdims=True)).astype(dtype)
+
+        self.reset()
+
+    def reset(self):
+        # inputs before the stream start are zeros
+        self._buffer = np.zeros(self.half_taps - 1, dtype=self.dtype)
+        self._buffer_start = 1 - self.half_taps
+        self._consumed = 0
+        self._next_output = 0
+
+    def process(self, chunk: np.array) -> np.array:
+        """
+        Inp Parameters:
+
+            chunk : next 1channel samples of the input, of any length
+
+        Out Parameters:
+
+            np.array of the output samples which became computable
+        """
+        chunk = np.asarray(chunk)
+        if self.up == self.down:
+            self._consumed += chunk.shape[0]
+            return chunk.astype(self.dtype)
+
+        self._buffer = np.concatenate((self._buffer, chunk.astype(self.dtype, copy=False)))
+        self._consumed += chunk.shape[0]
+
+        # output n needs inputs up to n * down // up + half_taps
+        last_input = self._consumed - 1 - self.half_taps
+        end = max(self._next_output, -(-(last_input + 1) * self.up // self.down))
+        return self._emit(end)
+
+    def flush(self) -> np.array:
+        """
+        Returns the outputs still held back by the filter delay, as if the
+        input was followed by silence, and resets the resampler
+        """
+        if self.up == self.down:
+            self.reset()
+            return np.zeros(0, dtype=self.dtype)
+
+        total = -(-self._consumed * self.up // self.down)
+        self._buffer = np.concatenate(
+            (self._buffer, np.zeros(self.half_taps + 1, dtype=self.dtype))
+        )
+        out = self._emit(total)
+        self.reset()
+        return out
+
+    def _emit(self, end: int) -> np.array:
+        n = np.arange(self._next_output, end, dtype=np.int64)
+        input_index = n * self.down // self.up
+        starts = input_index - self.half_taps + 1 - self._buffer_start
+
+        if n.size == 0:
+            # the buffer can be shorter than the filter before the first output
+            return np.zeros(0, dtype=self.dtype)
+
+        windows = np.lib.stride_tricks.sliding_window_view(
+            self._buffer, 2 * self.half_taps
+        )
+        if self.up == 1:
+            # integer decimation, all outputs share the phase 0 taps and
+            # the windows are a strided view, no gather needed
+            out = windows[starts[0] :: self.down][: n.shape[0]] @ self.taps[0]
+        else:
+            phases = n * self.down - input_index * self.up
+            out = np.einsum("ij,ij->i", windows[starts], self.taps[phases])
+
+        self._next_output = end
+        drop = end * self.down // self.up - self.half_taps + 1 - self._buffer_start
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+        return out.astype(self.dtype, copy=False)
+
+
+def resample_audio(
+    audio: np.array, orig_rate: int, target_rate: int = RATE, **kwargs
+) -> np.array:
+    """
+    Resamples a whole recording with PolyphaseResampler
+
+    Inp Parameters:
+
+        audio : np.array of 1channel audio sampled at orig_rate
+
+        kwargs : passed to PolyphaseResampler
+
+    Out Parameters:
+
+        np.array of ceil(len(audio) * target_rate / orig_rate) samples
+    """
+    resampler = PolyphaseResampler(orig_rate, target_rate, **kwargs)
+    # a second at a time, keeps the gathered filter windows cache sized
+    out = [
+        resampler.process(audio[start : start + resampler.orig_rate])
+        for start in range(0, audio.shape[0], resampler.orig_rate)
+    ]
+    out.append(resampler.flush())
+    return np.concatenate(out)
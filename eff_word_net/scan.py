@@ -0,0 +1,250 @@
+"""
+Offline hotword detection over recorded audio
+
+Can be run directly in cli
+`python -m eff_word_net.scan`
+"""
+
+import os
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+import typer
+
+from eff_word_net import RATE
+from eff_word_net.audio_processing import ModelRawBackend, Resnet50_Arc_loss
+from eff_word_net.engine import HotwordDetector
+from eff_word_net.inference_pool import InferencePool
+from eff_word_net.streams import read_audio_blocks
+
+Detection = dict
+
+
+def _sliding_windows(audio: np.array, window_frames: int, hop_frames: int) -> np.array:
+    """
+    Returns a (N, window_frames) strided view of windows starting every
+    hop_frames samples, the tail is zero padded so every sample is covered
+    """
+    n_windows = 1 + max(0, -(-(audio.shape[0] - window_frames) // hop_frames))
+    padded_length = (n_windows - 1) * hop_frames + window_frames
+    if padded_length > audio.shape[0]:
+        audio = np.concatenate(
+            (audio, np.zeros(padded_length - audio.shape[0], dtype=audio.dtype))
+        )
+    return np.lib.stride_tricks.sliding_window_view(audio, window_frames)[::hop_frames]
+
+
+def _block_windows(
+    blocks: Iterable[np.array], window_frames: int, hop_frames: int, batch_size: int
+) -> Iterator[np.array]:
+    """
+    Yields batches of at most batch_size consecutive windows over audio
+    arriving in blocks of any size, the windows are the same as those of
+    _sliding_windows over the whole audio but only a batch worth of audio
+    is held at a time
+    """
+    batch_frames = max(window_frames + (batch_size - 1) * hop_frames, batch_size * hop_frames)
+    buffer = np.zeros(0, dtype=np.float32)
+    emitted = 0
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float32)
+        buffer = np.concatenate((buffer, block)) if buffer.shape[0] else block
+        while buffer.shape[0] >= batch_frames:
+            yield np.lib.stride_tricks.sliding_window_view(
+                buffer[: window_frames + (batch_size - 1) * hop_frames], window_frames
+            )[::hop_frames]
+            buffer = buffer[batch_size * hop_frames :]
+            emitted += batch_size
+    # remaining windows, unless the last batch already reached the end
+    if emitted == 0 or buffer.shape[0] > window_frames - hop_frames:
+        windows = _sliding_windows(buffer, window_frames, hop_frames)
+        for start in range(0, windows.shape[0], batch_size):
+            yield windows[start : start + batch_size]
+
+
+def scan_blocks(
+    blocks: Iterable[np.array],
+    model: ModelRawBackend,
+    detectors: Union[HotwordDetector, List[HotwordDetector]],
+    hop_secs: float = 0.25,
+    batch_size: int = None,
+    start_secs: float = 0.0,
+    embedder=None,
+) -> Iterator[Detection]:
+    """
+    Slides the model window over a 16000Hz mono recording arriving in
+    blocks and yields hotword detections in timeline order, only a batch
+    of windows worth of audio is held in memory
+
+    Inp Parameters:
+
+        blocks : iterable of consecutive np.array blocks of 1channel
+        16000Hz sampled audio of any size
+
+        model : model used to generate the detectors reference files
+
+        detectors : HotwordDetector or list of them, their embeddings,
+        threshold and relaxation_time are used, relaxation_time is applied
+        on the recording timeline instead of wall clock time
+
+        hop_secs : gap between consecutive windows
+
+        batch_size : windows embedded per call, defaults to the embedder
+        max_batch_size
+
+        start_secs : timeline offset added to reported times
+
+        embedder : object computing the embeddings with an audioToVectors
+        method, such as an InferencePool spreading windows across CPU
+        cores, defaults to model
+
+    Out Parameters:
+
+        generator of {
+            "hotword": str,
+            "start": window start in seconds,
+            "end": window end in seconds,
+            "confidence": float value
+        }
+    """
+    if isinstance(detectors, HotwordDetector):
+        detectors = [detectors]
+    assert len(detectors) > 0, "Pass atleast 1 HotwordDetector instance"
+
+    hop_frames = int(hop_secs * RATE)
+    assert hop_frames > 0, "hop_secs too small"
+    embedder = embedder or model
+    batch_size = batch_size or getattr(embedder, "max_batch_size", 32)
+
+    embeddings = np.ascontiguousarray(
+        np.concatenate([d.embeddings for d in detectors]), dtype=np.float32
+    )
+    group_starts = np.cumsum([0] + [d.embeddings.shape[0] for d in detectors[:-1]])
+    thresholds = np.array([d.threshold for d in detectors])
+    last_detection = np.full(len(detectors), -np.inf)
+
+    window_index = 0
+    for batch in _block_windows(blocks, model.window_frames, hop_frames, batch_size):
+        vectors = embedder.audioToVectors(np.ascontiguousarray(batch))
+
+        for vector in vectors:
+            window_start = window_index * hop_frames / RATE + start_secs
+            window_index += 1
+            scores = model.scoreVectorGroups(vector, embeddings, group_starts)
+
+            for i in np.flatnonzero(scores >= thresholds):
+                detector = detectors[i]
+                if window_start - last_detection[i] < detector.relaxation_time:
+                    continue
+                last_detection[i] = window_start
+                yield {
+                    "hotword": detector.hotword,
+                    "start": window_start,
+                    "end": window_start + model.window_length,
+                    "confidence": float(scores[i]),
+                }
+
+
+def scan_array(
+    audio: np.array,
+    model: ModelRawBackend,
+    detectors: Union[HotwordDetector, List[HotwordDetector]],
+    hop_secs: float = 0.25,
+    batch_size: int = None,
+    start_secs: float = 0.0,
+    embedder=None,
+) -> Iterator[Detection]:
+    """
+    scan_blocks over a whole recording held in memory
+
+    Inp Parameters:
+
+        audio : np.array of 1channel 16000Hz sampled audio of any length
+
+        other parameters are same as in scan_blocks
+    """
+    yield from scan_blocks(
+        [audio],
+        model,
+        detectors,
+        hop_secs=hop_secs,
+        batch_size=batch_size,
+        start_secs=start_secs,
+        embedder=embedder,
+    )
+
+
+def scan_file(
+    audio_file: str,
+    model: ModelRawBackend,
+    detectors: Union[HotwordDetector, List[HotwordDetector]],
+    hop_secs: float = 0.25,
+    batch_size: int = None,
+    embedder=None,
+    block_secs: float = 10,
+) -> Iterator[Detection]:
+    """
+    scan_blocks over an audio file, any format and sample rate supported
+    by soundfile, multi channel audio is mixed down to mono. The file is
+    decoded block_secs at a time, so memory stays bounded for recordings
+    of any length
+    """
+    yield from scan_blocks(
+        read_audio_blocks(audio_file, block_secs),
+        model,
+        detectors,
+        hop_secs=hop_secs,
+        batch_size=batch_size,
+        embedder=embedder,
+    )
+
+
+def scan(
+    audio_file: List[str] = typer.Option(..., help="Audio file to scan, can be repeated"),
+    reference_file: List[str] = typer.Option(
+        ..., help="Reference file of a hotword, can be repeated"
+    ),
+    threshold: float = typer.Option(0.7, help="Detection threshold"),
+    relaxation_time: float = typer.Option(2.0, help="Relaxation time in seconds"),
+    hop_secs: float = typer.Option(0.25, help="Gap between windows in seconds"),
+    batch_size: int = typer.Option(32, help="Windows embedded per model call"),
+    workers: int = typer.Option(
+        1, help="Inference worker processes, 0 to use every CPU core"
+    ),
+):
+    """
+    Prints timestamped hotword detections of recorded audio files, hotword
+    names are taken from the reference file names
+    """
+    model = Resnet50_Arc_loss(max_batch_size=batch_size)
+    detectors = [
+        HotwordDetector(
+            hotword=os.path.basename(f).split("_ref")[0],
+            model=model,
+            reference_file=f,
+            threshold=threshold,
+            relaxation_time=relaxation_time,
+        )
+        for f in reference_file
+    ]
+
+    pool = None
+    if workers != 1:
+        pool = InferencePool(n_workers=workers or None, max_batch_size=batch_size)
+
+    try:
+        for f in audio_file:
+            for detection in scan_file(
+                f, model, detectors, hop_secs=hop_secs, embedder=pool
+            ):
+                print(
+                    f"{f}\t{detection['start']:.2f}s-{detection['end']:.2f}s\t"
+                    f"{detection['hotword']}\t{detection['confidence']:.4f}"
+                )
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    typer.run(scan)
@@ -0,0 +1,209 @@
+"""
+Serving many concurrent audio streams with one shared model, windows of
+all streams are queued and embedded together in dynamically formed batches
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from time import perf_counter
+from typing import Callable, Union
+
+import numpy as np
+
+from eff_word_net.audio_processing import ModelRawBackend
+from eff_word_net.engine import HotwordDetector, MultiHotwordDetector
+
+Detector = Union[HotwordDetector, MultiHotwordDetector, None]
+
+
+class BatchingInferenceServer:
+    """
+    Collects windows submitted from any number of threads and runs them
+    through one model in batches of up to max_batch_size, a batch is sent
+    as soon as it is full or its oldest window waited max_wait_ms
+
+    Results are scored on the server thread with the detector passed along
+    every window, so per detector state (relaxation_time) is only ever
+    touched by a single thread
+    """
+
+    def __init__(
+        self, model: ModelRawBackend, max_batch_size: int = 16, max_wait_ms: float = 10
+    ):
+        """
+        Inp Parameters:
+
+            model : model shared by every stream
+
+            max_batch_size : max windows embedded per model call
+
+            max_wait_ms : max time a window waits for the batch to fill up
+        """
+        assert max_batch_size > 0, "max_batch_size should be atleast 1"
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.batches_run = 0
+        self.windows_run = 0
+
+        self._queue = queue.Queue()
+        self._running = False
+        self._thread = None
+        # held while checking _running and queueing, so no window is queued
+        # after stop and missed by the serve loop
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops accepting windows, windows already queued are still served
+        """
+        with self._submit_lock:
+            self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._failQueued(RuntimeError("server stopped"))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submitFrame(self, inp_audio_frame: np.array, detector: Detector = None) -> Future:
+        """
+        Queues a window for embedding
+
+        Inp Parameters:
+
+            inp_audio_frame : 1.5 sec 16000Hz window, it is copied so stream
+            buffers can be reused right away
+
+            detector : HotwordDetector, MultiHotwordDetector or None
+
+        Out Parameters:
+
+            Future resolving to the same result as detector.scoreFrame
+            (HotwordDetector, with unsafe=True) or detector.findBestMatch
+            (MultiHotwordDetector), or the embedding when detector is None
+        """
+        assert self._running, "server is not started"
+        future = self._enqueue(self._checkFrame(inp_audio_frame), detector)
+        assert future is not None, "server is stopped"
+        return future
+
+    def _checkFrame(self, inp_audio_frame: np.array) -> np.array:
+        inp_audio_frame = np.array(inp_audio_frame, dtype=np.float32)
+        # checked here, a bad window would fail the whole batch it lands in
+        assert inp_audio_frame.shape == (self.model.window_frames,), (
+            f"Audio frame needs to be of shape ({self.model.window_frames},)"
+        )
+        return inp_audio_frame
+
+    def _enqueue(self, inp_audio_frame: np.array, detector: Detector) -> Future:
+        """
+        Queues a checked window, returns None once the server is stopped
+        """
+        with self._submit_lock:
+            if not self._running:
+                return None
+            future = Future()
+            self._queue.put((inp_audio_frame, detector, future))
+        return future
+
+    def _failQueued(self, exception: Exception):
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            future.set_exception(exception)
+
+    def attachStream(
+        self, stream, detector: Detector, callback: Callable[[object], None]
+    ) -> threading.Thread:
+        """
+        Starts a thread pulling windows from a started CustomAudioStream
+        like object (anything with getFrame) until the server stops or
+        getFrame returns None at the end of the stream, every result is
+        passed to callback on the server thread
+        """
+
+        def pump():
+            while self._running:
+                frame = stream.getFrame()
+                if frame is None:
+                    break
+                future = self._enqueue(self._checkFrame(frame), detector)
+                if future is None:
+                    break
+                future.add_done_callback(lambda f: callback(f.result()))
+
+        thread = threading.Thread(target=pump, daemon=True)
+        thread.start()
+        return thread
+
+    def _collectBatch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _scoreEmbedding(embedding: np.array, detector: Detector):
+        if detector is None:
+            return embedding
+        if isinstance(detector, MultiHotwordDetector):
+            return detector.findBestVectorMatch(embedding)
+        score = detector.scoreVector(embedding)
+        return {"match": score >= detector.threshold, "confidence": score}
+
+    def _serve(self):
+        while self._running or not self._queue.empty():
+            batch = self._collectBatch()
+            if len(batch) == 0:
+                continue
+
+            try:
+                embeddings = self.model.audioToVectors(
+                    np.stack([window for window, _, _ in batch])
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.windows_run += len(batch)
+            for embedding, (_, detector, future) in zip(embeddings, batch):
+                try:
+                    future.set_result(
+                        self._scoreEmbedding(embedding[np.newaxis], detector)
+                    )
+                except Exception as e:
+                    future.set_exception(e)
@@ -14,8 +14,11 @@ def single_word_test(
     relaxation_time: float = typer.Option(2.0, help="Relaxation time in seconds"),
     window_length_secs: float = typer.Option(1.5, help="Window length in seconds"),
     sliding_window_secs: float = typer.Option(0.75, help="Sliding window in seconds"),
+    quantized: bool = typer.Option(False, help="Use the int8 quantized model"),
 ):
-    base_model = Resnet50_Arc_loss()
+    base_model = Resnet50_Arc_loss(
+        use_quantized_model=quantized, sliding_window_secs=sliding_window_secs
+    )
 
     hw_detector = HotwordDetector(
         hotword=hotword,
@@ -1,8 +1,9 @@
-import pyaudio
-from typing import Tuple , Callable
+import threading
+from time import perf_counter
+from typing import Tuple , Callable, Iterator
 import numpy as np
-from eff_word_net.engine import HotwordDetector
 from eff_word_net import RATE
+from eff_word_net.resample import PolyphaseResampler
 
 NoParameterFunction = Callable[[],None]
 AudioFrameFunction = Callable[[],np.array]
@@ -21,78 +22,601 @@ class CustomAudioStream :
         close_stream:Callable[[],None],
         get_next_frame:Callable[[],np.array],
         window_length_secs = 1,
-        sliding_window_secs:float = 1/8
+        sliding_window_secs:float = 1/8,
+        dtype = np.float64
         ):
+        """
+        Inp Parameters:
+
+            dtype : dtype of the returned audio windows, incoming frames
+            are cast to it when copied into the stream buffer
+        """
 
         self._open_stream = open_stream
         self._close_stream = close_stream
         self._get_next_frame = get_next_frame
         self._window_size = int(window_length_secs * RATE)
         self._sliding_window_size = int(sliding_window_secs * RATE)
+        self._dtype = dtype
+
+        assert self._sliding_window_size <= self._window_size, \
+            "sliding_window_secs cant be larger than window_length_secs"
+
+        # the buffer holds a few windows worth of audio, new frames are
+        # appended after the current window and the window is only moved
+        # back to the front once the buffer runs out of room
+        self._buffer = np.zeros(4 * self._window_size, dtype=dtype)
+        self._window_end = self._window_size #blank 1 sec audio
+        print("Initial S",self._buffer[:self._window_end].shape)
 
-        self._out_audio = np.zeros(self._window_size) #blank 1 sec audio
-        print("Initial S",self._out_audio.shape)
+    def _resetBuffer(self):
+        self._buffer[:self._window_size] = 0
+        self._window_end = self._window_size
 
     def start_stream(self):
-        self._out_audio = np.zeros(self._window_size)
+        self._resetBuffer()
         self._open_stream()
         for i in range(RATE//self._sliding_window_size -1):
             self.getFrame()
 
     def close_stream(self):
         self._close_stream()
-        self._out_audio = np.zeros(self._window_size)
+        self._resetBuffer()
 
     def getFrame(self):
         """
         Returns a 1 sec audio frame with sliding window of 1/8 sec with 
         sampling frequency 16000Hz
+
+        The returned array is a view into the stream buffer, it is only
+        valid till the next getFrame call, copy it to keep it around
         """
 
         new_frame = self._get_next_frame()
 
-        #print("Prior:", self._out_audio.shape, new_frame.shape )
+        #print("Prior:", self._buffer.shape, new_frame.shape )
         assert new_frame.shape == (self._sliding_window_size,), \
             "audio frame size from src doesnt match sliding_window_secs"
 
+        if self._window_end + self._sliding_window_size > self._buffer.shape[0]:
+            keep = self._window_size - self._sliding_window_size
+            self._buffer[:keep] = self._buffer[self._window_end - keep:self._window_end]
+            self._window_end = keep
+
+        self._buffer[self._window_end:self._window_end + self._sliding_window_size] = new_frame
+        self._window_end += self._sliding_window_size
+
+        return self._buffer[self._window_end - self._window_size:self._window_end]
+
+class ResampledAudioStream(CustomAudioStream) :
+    """
+    CustomAudioStream over a source of any sample rate, chunks of any size
+    are resampled to 16000Hz with a PolyphaseResampler and cut into
+    sliding_window_secs hops
+    """
+    def __init__(
+        self,
+        open_stream:Callable[[],None],
+        close_stream:Callable[[],None],
+        get_next_chunk:Callable[[],np.array],
+        input_rate:int,
+        window_length_secs = 1,
+        sliding_window_secs:float = 1/8,
+        dtype = np.float64
+        ):
+        """
+        Inp Parameters:
+
+            get_next_chunk : returns the next chunk of 1channel audio
+            sampled at input_rate, of any length, or None once the source
+            is exhausted
+
+            input_rate : sample rate of the source, 16000 skips resampling
 
-        self._out_audio = np.append(
-                self._out_audio[self._sliding_window_size:],
-            new_frame 
+            other parameters are same as in CustomAudioStream
+        """
+        self._get_next_chunk = get_next_chunk
+        self._resampler = PolyphaseResampler(input_rate, RATE, dtype=dtype)
+        self._leftover = np.zeros(0, dtype=dtype)
+        self._source_done = False
+        self._hops_read = 0
+
+        CustomAudioStream.__init__(
+            self,
+            open_stream = self._openResampled(open_stream),
+            close_stream = close_stream,
+            get_next_frame = self._nextResampledHop,
+            window_length_secs=window_length_secs,
+            sliding_window_secs=sliding_window_secs,
+            dtype=dtype
         )
 
-        #print(self._out_audio.shape)
+    def _openResampled(self, open_stream:Callable[[],None]) -> Callable[[],None]:
+        def open_resampled():
+            self._resampler.reset()
+            self._leftover = self._leftover[:0]
+            self._source_done = False
+            self._hops_read = 0
+            open_stream()
+        return open_resampled
+
+    def _fillHop(self) -> bool:
+        while self._leftover.shape[0] < self._sliding_window_size:
+            if self._source_done:
+                if self._leftover.shape[0] == 0:
+                    return False
+                # last partial hop of the source is completed with silence
+                self._leftover = np.concatenate((
+                    self._leftover,
+                    np.zeros(self._sliding_window_size - self._leftover.shape[0], dtype=self._dtype)
+                ))
+                break
+            chunk = self._get_next_chunk()
+            if chunk is None:
+                self._source_done = True
+                chunk = self._resampler.flush()
+            else:
+                chunk = self._resampler.process(chunk)
+            # sources delivering whole 16000Hz hops are passed on uncopied
+            self._leftover = chunk if self._leftover.shape[0] == 0 else \
+                np.concatenate((self._leftover, chunk))
+        return True
 
-        return self._out_audio
+    @property
+    def timeline_secs(self) -> float:
+        """
+        Position of the end of the last window on the source timeline, in
+        seconds of audio read since start_stream
+        """
+        return self._hops_read * self._sliding_window_size / RATE
 
-class SimpleMicStream(CustomAudioStream) :
+    def _nextResampledHop(self) -> np.array:
+        self._hops_read += 1
+        hop = self._leftover[:self._sliding_window_size]
+        self._leftover = self._leftover[self._sliding_window_size:]
+        return hop
+
+    def getFrame(self):
+        """
+        Returns the next window like CustomAudioStream.getFrame, or None
+        once get_next_chunk is exhausted and all its audio is consumed
+        """
+        if not self._fillHop():
+            return None
+        return CustomAudioStream.getFrame(self)
+
+def read_audio_blocks(audio_file:str, block_secs:float = 10) -> Iterator[np.array]:
+    """
+    Decodes an audio file block by block into 1channel 16000Hz float32
+    audio, multi channel audio is mixed down and other sample rates are
+    resampled, so memory stays bounded whatever the file length
+
+    Inp Parameters:
+
+        audio_file : any format supported by soundfile
+
+        block_secs : seconds of audio decoded at once
+    """
+    # imported here so streams without files dont need soundfile
+    import soundfile as sf
+
+    samplerate = sf.info(audio_file).samplerate
+    resampler = PolyphaseResampler(samplerate, RATE)
+    for block in sf.blocks(
+        audio_file, blocksize=int(block_secs * samplerate), dtype="float32", always_2d=True
+    ):
+        yield resampler.process(block.mean(axis=1))
+    yield resampler.flush()
+
+class FileAudioStream(ResampledAudioStream) :
+    """
+    CustomAudioStream reading an audio file block by block, so detectors
+    written against mic streams run on recordings of any length as fast as
+    inference allows. getFrame returns None at the end of the file
+
+    Frames come faster than realtime, so detectors should measure
+    relaxation_time on the file timeline instead of wall clock time
+
+        stream = FileAudioStream("call.wav", window_length_secs=1.5, sliding_window_secs=0.75)
+        detector = HotwordDetector(..., clock=lambda: stream.timeline_secs)
+        stream.start_stream()
+        while (frame := stream.getFrame()) is not None:
+            result = detector.scoreFrame(frame)
+    """
+    def __init__(self, audio_file:str, window_length_secs=1, sliding_window_secs:float=1/8,
+            dtype=np.float64, block_secs:float=10):
+        """
+        Inp Parameters:
+
+            audio_file : any format and sample rate supported by soundfile
+
+            block_secs : seconds of audio decoded at once
+
+            other parameters are same as in CustomAudioStream
+        """
+        self.audio_file = audio_file
+        self._block_secs = block_secs
+        self._blocks = None
+
+        ResampledAudioStream.__init__(
+            self,
+            open_stream = self._openFile,
+            close_stream = self._closeFile,
+            get_next_chunk = lambda : next(self._blocks, None),
+            input_rate = RATE,
+            window_length_secs=window_length_secs,
+            sliding_window_secs=sliding_window_secs,
+            dtype=dtype
+        )
+
+    def _openFile(self):
+        self._closeFile()
+        self._blocks = read_audio_blocks(self.audio_file, self._block_secs)
+
+    def _closeFile(self):
+        if self._blocks is not None:
+            # closing the generator closes the file
+            self._blocks.close()
+            self._blocks = None
+
+class SimpleMicStream(ResampledAudioStream) :
 
     """
     Implements mic stream with sliding window, 
     implemented by inheriting CustomAudioStream
+
+    rate is the sample rate the mic is opened with, for devices which
+    only support rates like 44100 or 48000, audio is resampled to 16000Hz
     """
-    def __init__(self,window_length_secs=1, sliding_window_secs:float=1/8):
+    def __init__(self,window_length_secs=1, sliding_window_secs:float=1/8, dtype=np.float64,
+                 rate:int=RATE):
+        # imported here so streams without a mic dont need pyaudio
+        import pyaudio
+
         p=pyaudio.PyAudio()
 
-        CHUNK = int(sliding_window_secs*RATE)
+        CHUNK = int(sliding_window_secs*rate)
         print("Chunk size", CHUNK)
         mic_stream=p.open(
             format=pyaudio.paInt16,
             channels=1,
-            rate=16000,
+            rate=rate,
             input=True,
             frames_per_buffer=CHUNK
         )
 
         mic_stream.stop_stream()
 
-        CustomAudioStream.__init__(
+        ResampledAudioStream.__init__(
             self,
             open_stream = mic_stream.start_stream,
             close_stream = mic_stream.stop_stream,
-            get_next_frame = lambda : (
+            get_next_chunk = lambda : (
                 np.frombuffer(mic_stream.read(CHUNK,exception_on_overflow = False),dtype=np.int16) 
                 ),
+                input_rate=rate,
                  window_length_secs=window_length_secs,
-                sliding_window_secs=sliding_window_secs
+                sliding_window_secs=sliding_window_secs,
+                dtype=dtype
         )
+
+
+class RingBuffer :
+    """
+    Single producer single consumer ring buffer of audio samples
+
+    Only the producer moves the write index and only the consumer moves the
+    read index, each index is published after the samples it covers are
+    copied, so the two threads never need a lock
+    """
+    def __init__(self, capacity:int, dtype=np.float64):
+        assert capacity > 0, "capacity should be atleast 1 sample"
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=dtype)
+        # total samples written / read since creation
+        self._write_index = 0
+        self._read_index = 0
+
+    @property
+    def available(self) -> int:
+        return self._write_index - self._read_index
+
+    def clear(self):
+        """
+        Drops buffered samples, only call it while the producer is idle
+        """
+        self._read_index = self._write_index
+
+    def write(self, chunk:np.array) -> bool:
+        """
+        Appends chunk, returns False without writing anything when it does
+        not fit in the free space
+        """
+        n = chunk.shape[0]
+        if n > self.capacity - self.available:
+            return False
+
+        start = self._write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = chunk[:first]
+        self._data[:n - first] = chunk[first:]
+        self._write_index += n
+        return True
+
+    def read(self, out:np.array) -> bool:
+        """
+        Fills out with the oldest samples, returns False without reading
+        anything when fewer than out.shape[0] samples are buffered
+        """
+        n = out.shape[0]
+        if n > self.available:
+            return False
+
+        start = self._read_index % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:n - first]
+        self._read_index += n
+        return True
+
+class ThreadedAudioStream(CustomAudioStream) :
+    """
+    CustomAudioStream whose audio is captured independently of the thread
+    calling getFrame, so slow inference never stalls the audio source
+
+    Audio either comes from a capture thread repeatedly calling read_chunk,
+    or is pushed with pushChunk from a driver callback. It is buffered in a
+    RingBuffer of buffer_secs, chunks which do not fit because inference
+    fell that far behind are dropped and counted
+    """
+    def __init__(
+        self,
+        open_stream:Callable[[],None],
+        close_stream:Callable[[],None],
+        read_chunk:Callable[[],np.array] = None,
+        window_length_secs = 1,
+        sliding_window_secs:float = 1/8,
+        buffer_secs:float = 4,
+        dtype = np.float64
+        ):
+        """
+        Inp Parameters:
+
+            read_chunk : blocking function returning the next audio chunk of
+            any size, or None once the source is exhausted. When None, audio
+            has to be pushed with pushChunk
+
+            buffer_secs : audio buffered between capture and getFrame
+
+            other parameters are same as in CustomAudioStream
+        """
+        CustomAudioStream.__init__(
+            self,
+            open_stream = self._openCapture,
+            close_stream = self._closeCapture,
+            get_next_frame = self._nextHop,
+            window_length_secs = window_length_secs,
+            sliding_window_secs = sliding_window_secs,
+            dtype = dtype
+        )
+        assert int(buffer_secs * RATE) >= self._sliding_window_size, \
+            "buffer_secs cant be smaller than sliding_window_secs"
+
+        self._open_capture = open_stream
+        self._close_capture = close_stream
+        self._read_chunk = read_chunk
+        self._ring = RingBuffer(int(buffer_secs * RATE), dtype=dtype)
+        self._hop = np.zeros(self._sliding_window_size, dtype=dtype)
+        self._data_ready = threading.Event()
+        self._capture_thread = None
+        self._running = False
+        self._source_done = False
+
+        self.captured_chunks = 0
+        self.dropped_chunks = 0
+        self.overflowed_chunks = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of whole hops captured but not yet consumed by getFrame
+        """
+        return self._ring.available // self._sliding_window_size
+
+    @property
+    def lag_secs(self) -> float:
+        """
+        How far getFrame runs behind capture
+        """
+        return self._ring.available / RATE
+
+    def pushChunk(self, chunk:np.array, overflowed:bool = False) -> bool:
+        """
+        Hands a captured chunk over to the consumer side, called from the
+        capture thread or the audio driver callback
+
+        Inp Parameters:
+
+            chunk : np.array of 1channel 16000Hz audio of any size
+
+            overflowed : whether the source reported lost samples before
+            this chunk
+
+        Out Parameters:
+
+            False when the chunk was dropped because the buffer is full
+        """
+        self.captured_chunks += 1
+        if overflowed:
+            self.overflowed_chunks += 1
+        written = self._ring.write(chunk)
+        if not written:
+            self.dropped_chunks += 1
+        self._data_ready.set()
+        return written
+
+    def _capture(self):
+        while self._running:
+            chunk = self._read_chunk()
+            if chunk is None:
+                break
+            self.pushChunk(chunk)
+        self._source_done = True
+        self._data_ready.set()
+
+    def _openCapture(self):
+        self._ring.clear()
+        self._source_done = False
+        self._running = True
+        self._open_capture()
+        if self._read_chunk is not None:
+            self._capture_thread = threading.Thread(target=self._capture, daemon=True)
+            self._capture_thread.start()
+
+    def _closeCapture(self):
+        self._running = False
+        self._data_ready.set()
+        if self._capture_thread is not None:
+            self._capture_thread.join()
+            self._capture_thread = None
+        self._close_capture()
+
+    def _waitForHop(self) -> bool:
+        while self._ring.available < self._sliding_window_size:
+            if self._source_done or not self._running:
+                return False
+            self._data_ready.clear()
+            # recheck after clearing so a write in between is not missed
+            if self._ring.available >= self._sliding_window_size:
+                break
+            self._data_ready.wait(0.1)
+        return True
+
+    def _nextHop(self) -> np.array:
+        self._ring.read(self._hop)
+        return self._hop
+
+    def getFrame(self):
+        """
+        Blocks till a hop of audio is captured and returns the updated
+        window, returns None once the stream is closed or read_chunk is
+        exhausted and all buffered audio is consumed
+        """
+        if not self._waitForHop():
+            return None
+        return CustomAudioStream.getFrame(self)
+
+class ThreadedMicStream(ThreadedAudioStream) :
+    """
+    Mic stream captured in PyAudio callback mode, the driver thread writes
+    into the ring buffer while the application thread runs inference
+
+    rate is the sample rate the mic is opened with, for devices which
+    only support rates like 44100 or 48000, the driver thread resamples
+    audio to 16000Hz before buffering it
+    """
+    def __init__(self, window_length_secs=1, sliding_window_secs:float=1/8,
+            buffer_secs:float=4, dtype=np.float64, rate:int=RATE):
+        import pyaudio
+
+        p=pyaudio.PyAudio()
+
+        CHUNK = int(sliding_window_secs*rate)
+        resampler = PolyphaseResampler(rate, RATE, dtype=dtype)
+
+        def callback(in_data, frame_count, time_info, status):
+            self.pushChunk(
+                resampler.process(np.frombuffer(in_data, dtype=np.int16)),
+                overflowed = bool(status & pyaudio.paInputOverflow)
+            )
+            return (None, pyaudio.paContinue)
+
+        mic_stream=p.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=rate,
+            input=True,
+            frames_per_buffer=CHUNK,
+            stream_callback=callback,
+            start=False
+        )
+
+        def open_stream():
+            resampler.reset()
+            mic_stream.start_stream()
+
+        ThreadedAudioStream.__init__(
+            self,
+            open_stream = open_stream,
+            close_stream = mic_stream.stop_stream,
+            window_length_secs = window_length_secs,
+            sliding_window_secs = sliding_window_secs,
+            buffer_secs = buffer_secs,
+            dtype = dtype
+        )
+
+class InferenceThread :
+    """
+    Consumer side of the pipeline, pulls windows from a started stream and
+    scores them on a background thread
+
+        stream = ThreadedMicStream(window_length_secs=1.5, sliding_window_secs=0.75)
+        stream.start_stream()
+        worker = InferenceThread(stream, mycroft_hw.scoreFrame, print)
+        worker.start()
+    """
+    def __init__(self, stream, score_frame:Callable[[np.array],object],
+            callback:Callable[[object],None]):
+        """
+        Inp Parameters:
+
+            stream : started stream with a getFrame method returning None
+            once it ends, such as ThreadedAudioStream
+
+            score_frame : function scoring a window, for example
+            HotwordDetector.scoreFrame or MultiHotwordDetector.findBestMatch
+
+            callback : called with every score_frame result
+        """
+        self.stream = stream
+        self._score_frame = score_frame
+        self._callback = callback
+        self._running = False
+        self._thread = None
+
+        self.frames_scored = 0
+        self.inference_secs = 0.0
+
+    @property
+    def mean_inference_secs(self) -> float:
+        return self.inference_secs / max(self.frames_scored, 1)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops after the window being scored, close the stream as well when
+        its getFrame may block
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def join(self, timeout:float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while self._running:
+            frame = self.stream.getFrame()
+            if frame is None:
+                break
+            start = perf_counter()
+            result = self._score_frame(frame)
+            self.inference_secs += perf_counter() - start
+            self.frames_scored += 1
+            self._callback(result)
@@ -0,0 +1,220 @@
+"""
+Voice activity detection used to skip model inference on windows holding
+only silence or noise
+"""
+
+import numpy as np
+
+from eff_word_net import RATE
+from eff_word_net.audio_utils import framesig, get_cached_filterbanks
+
+
+class VoiceActivityDetector:
+    """
+    Base class of the voice activity gate used by HotwordDetector and
+    MultiHotwordDetector
+
+    Subclasses implement _detectSpeech, this class adds the hangover (a few
+    windows keep passing after speech ends, so the tail of an utterance
+    still reaches the model) and counts the inferences the gate saved.
+    Subclasses setting uses_features receive the log-fbank features the
+    model computes anyway, so the gate adds no feature extraction cost
+    """
+
+    uses_features = False
+
+    def __init__(self, hangover_windows: int = 2):
+        """
+        Inp Parameters:
+
+            hangover_windows : windows let through after the last window
+            with speech
+        """
+        assert hangover_windows >= 0, "hangover_windows cant be negative"
+        self.hangover_windows = hangover_windows
+        self.reset()
+
+    def reset(self):
+        self.windows_seen = 0
+        self.windows_skipped = 0
+        self._hangover_left = 0
+
+    @property
+    def inferences_saved(self) -> int:
+        return self.windows_skipped
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.windows_skipped / max(self.windows_seen, 1)
+
+    def _detectSpeech(self, inp_audio_frame: np.array, features: np.array) -> bool:
+        raise NotImplementedError("Speech detection on base VoiceActivityDetector")
+
+    def isSpeech(self, inp_audio_frame: np.array, features: np.array = None) -> bool:
+        """
+        Inp Parameters:
+
+            inp_audio_frame : window of 1channel 16000Hz audio
+
+            features : log-fbank features of the window, of shape
+            (frames, nfilt), required when uses_features is set
+
+        Out Parameters:
+
+            False when the window can skip model inference
+        """
+        self.windows_seen += 1
+        if self._detectSpeech(inp_audio_frame, features):
+            self._hangover_left = self.hangover_windows
+            return True
+        if self._hangover_left > 0:
+            self._hangover_left -= 1
+            return True
+        self.windows_skipped += 1
+        return False
+
+
+class _NoiseFloorVAD(VoiceActivityDetector):
+    """
+    Frame level decision shared by the VAD implementations, a frame is
+    speech when its log energy is snr_db above a noise floor tracked across
+    windows and its noise measure (zero crossing rate, spectral flatness)
+    is below max_noisiness. A window is speech once min_speech_ratio of its
+    frames are
+    """
+
+    def __init__(
+        self,
+        snr_db: float,
+        max_noisiness: float,
+        min_speech_ratio: float,
+        noise_adaptation: float,
+        hangover_windows: int,
+    ):
+        super().__init__(hangover_windows)
+        self.snr = snr_db / 10 * np.log(10)  # natural log energy ratio
+        self.max_noisiness = max_noisiness
+        self.min_speech_ratio = min_speech_ratio
+        self.noise_adaptation = noise_adaptation
+
+    def reset(self):
+        super().reset()
+        self.noise_floor = None
+
+    def _updateNoiseFloor(self, log_energy: np.array):
+        quiet = np.percentile(log_energy, 10)
+        if self.noise_floor is None or quiet < self.noise_floor:
+            # drop right away, rise slowly so speech doesnt raise the floor
+            self.noise_floor = quiet
+        else:
+            self.noise_floor += self.noise_adaptation * (quiet - self.noise_floor)
+
+    def _decide(self, log_energy: np.array, noisiness: np.array) -> bool:
+        self._updateNoiseFloor(log_energy)
+        speech_frames = (log_energy > self.noise_floor + self.snr) & (
+            noisiness < self.max_noisiness
+        )
+        return speech_frames.mean() >= self.min_speech_ratio
+
+
+class EnergyVAD(_NoiseFloorVAD):
+    """
+    Time domain gate on short time energy and zero crossing rate, needs no
+    FFT so it is the cheapest option
+    """
+
+    def __init__(
+        self,
+        snr_db: float = 10,
+        max_zero_crossing_rate: float = 0.3,
+        min_speech_ratio: float = 0.1,
+        noise_adaptation: float = 0.05,
+        hangover_windows: int = 2,
+        frame_secs: float = 0.025,
+    ):
+        """
+        Inp Parameters:
+
+            snr_db : min frame energy above the noise floor for speech
+
+            max_zero_crossing_rate : frames crossing zero more often (per
+            sample) are treated as noise
+
+            min_speech_ratio : fraction of speech frames in a window
+            needed to run the model
+
+            noise_adaptation : rate at which the noise floor rises back
+            after dropping, per window
+
+            hangover_windows : see VoiceActivityDetector
+
+            frame_secs : analysis frame length, frames do not overlap
+        """
+        super().__init__(
+            snr_db, max_zero_crossing_rate, min_speech_ratio, noise_adaptation,
+            hangover_windows,
+        )
+        self.frame_len = int(frame_secs * RATE)
+
+    def _detectSpeech(self, inp_audio_frame: np.array, features: np.array) -> bool:
+        frames = framesig(inp_audio_frame, self.frame_len, self.frame_len, winfunc=None)
+        log_energy = np.log(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zero_crossing_rate = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return self._decide(log_energy, zero_crossing_rate)
+
+
+class SpectralVAD(_NoiseFloorVAD):
+    """
+    Gate on the log-fbank features of the model, frame energy and spectral
+    flatness (noise has a flat spectrum, voiced speech a peaky one) are
+    derived from the features, no extra audio processing is done
+    """
+
+    uses_features = True
+
+    def __init__(
+        self,
+        snr_db: float = 10,
+        max_flatness: float = 0.5,
+        min_speech_ratio: float = 0.1,
+        noise_adaptation: float = 0.05,
+        hangover_windows: int = 2,
+        nfilt: int = 64,
+        nfft: int = 512,
+        samplerate: int = RATE,
+    ):
+        """
+        Inp Parameters:
+
+            max_flatness : frames with a spectral flatness (between 0 and 1)
+            above it are treated as noise
+
+            nfilt, nfft, samplerate : filterbank the features were computed
+            with, the defaults match Resnet50_Arc_loss
+
+            other parameters are same as in EnergyVAD
+        """
+        super().__init__(
+            snr_db, max_flatness, min_speech_ratio, noise_adaptation,
+            hangover_windows,
+        )
+        # mel bands widen with frequency, flatness is measured on the
+        # energy per filter weight so white noise comes out flat
+        self._log_band_width = np.log(
+            get_cached_filterbanks(nfilt, nfft, samplerate, 0, samplerate / 2, np.float64).sum(axis=1)
+        )
+
+    def _detectSpeech(self, inp_audio_frame: np.array, features: np.array) -> bool:
+        assert features is not None, "SpectralVAD needs the log-fbank features"
+        log_bands = np.asarray(features, dtype=np.float64)
+        peak = log_bands.max(axis=1, keepdims=True)
+        log_energy = peak[:, 0] + np.log(np.exp(log_bands - peak).sum(axis=1))
+
+        log_density = log_bands - self._log_band_width
+        peak = log_density.max(axis=1, keepdims=True)
+        # geometric over arithmetic mean, computed in log domain
+        log_flatness = log_density.mean(axis=1) - (
+            peak[:, 0] + np.log(np.exp(log_density - peak).mean(axis=1))
+        )
+        return self._decide(log_energy, np.exp(log_flatness))
@@ -0,0 +1,65 @@
+"""
+Shared fixtures, the ResNet weights are not needed: the onnx inference of
+the model is replaced by the time averaged log-fbank energy above a floor,
+which is similar for windows holding the same sound and zero for silence
+and the quiet background noise
+"""
+
+import numpy as np
+import pytest
+
+from eff_word_net import RATE
+from eff_word_net.audio_processing import Resnet50_Arc_loss
+from eff_word_net.reference import save_reference
+
+
+def hotword_audio(secs: float = 0.6, seed: int = 0) -> np.array:
+    """
+    Rising chirp standing in for an uttered hotword
+    """
+    t = np.arange(int(secs * RATE)) / RATE
+    rng = np.random.default_rng(seed)
+    chirp = np.sin(2 * np.pi * (400 + 1500 * t / secs) * t) * np.hanning(t.shape[0])
+    return (0.5 * chirp + 0.01 * rng.standard_normal(t.shape[0])).astype(np.float32)
+
+
+def background(secs: float, seed: int = 0) -> np.array:
+    return (0.01 * np.random.default_rng(seed).standard_normal(int(secs * RATE))).astype(
+        np.float32
+    )
+
+
+@pytest.fixture
+def model():
+    model = Resnet50_Arc_loss(lazy=True)
+
+    def embed(features):
+        # log energy floor well above the background noise
+        energy = np.maximum(features, -5.0).mean(axis=-2) + 5.0
+        norm = np.linalg.norm(energy, axis=-1, keepdims=True)
+        return (energy / np.maximum(norm, 1e-12)).astype(np.float32)
+
+    def featuresToVector(features):
+        return embed(features)[np.newaxis]
+
+    def audioToVectors(batch, max_batch_size=None):
+        return embed(model.compute_logfbank_features(batch))
+
+    model.featuresToVector = featuresToVector
+    model.audioToVectors = audioToVectors
+    return model
+
+
+@pytest.fixture
+def reference_file(tmp_path, model):
+    windows = np.stack([background(1.5, seed) for seed in range(4)])
+    chirp = hotword_audio()
+    for window, start in zip(windows, [1000, 4000, 8000, 12000]):
+        window[start : start + chirp.shape[0]] += chirp
+    path = str(tmp_path / "chirp_ref.json")
+    save_reference(
+        path,
+        {"embeddings": model.audioToVectors(windows)},
+        {"model_type": "resnet_50_arc", "model_variant": model.model_variant},
+    )
+    return path
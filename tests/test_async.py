@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from conftest import background, hotword_audio
+from eff_word_net import RATE
+from eff_word_net.async_streams import AsyncAudioStream
+from eff_word_net.engine import HotwordDetector
+
+
+async def wav_chunks(wav_file: str, chunk_frames: int = 1000):
+    for block in sf.blocks(wav_file, blocksize=chunk_frames, dtype="float32"):
+        await asyncio.sleep(0)
+        yield block
+
+
+def write_wav(path, *parts) -> str:
+    sf.write(str(path), np.concatenate(parts), RATE, subtype="PCM_16")
+    return str(path)
+
+
+async def collect_matches(detector, wav_file, executor=None) -> list:
+    stream = AsyncAudioStream(
+        wav_chunks(wav_file), window_length_secs=1.5, sliding_window_secs=0.25
+    )
+    return [result async for result in detector.listen(stream, executor=executor)]
+
+
+def detector(model, reference_file) -> HotwordDetector:
+    return HotwordDetector(
+        "chirp", model, reference_file, threshold=0.85, relaxation_time=0
+    )
+
+
+def test_listen_finds_hotword_in_wav_chunks(tmp_path, model, reference_file):
+    with_hotword = write_wav(
+        tmp_path / "hotword.wav", background(2, 1), hotword_audio(seed=9), background(2, 2)
+    )
+    without_hotword = write_wav(tmp_path / "background.wav", background(5, 3))
+
+    matches = asyncio.run(collect_matches(detector(model, reference_file), with_hotword))
+    false_matches = asyncio.run(
+        collect_matches(detector(model, reference_file), without_hotword)
+    )
+
+    assert len(matches) > 0
+    assert all(result["match"] and result["confidence"] >= 0.85 for result in matches)
+    assert false_matches == []
+
+
+def test_concurrent_listeners_on_shared_model_run_inference_serially(
+    tmp_path, model, reference_file
+):
+    wav_file = write_wav(
+        tmp_path / "hotword.wav", background(2, 1), hotword_audio(seed=9), background(2, 2)
+    )
+    embed = model.featuresToVector
+    active = []
+    max_active = []
+    lock = threading.Lock()
+
+    def tracked_embed(features):
+        with lock:
+            active.append(None)
+            max_active.append(len(active))
+        time.sleep(0.002)  # widens the window for overlapping calls
+        try:
+            return embed(features)
+        finally:
+            with lock:
+                active.pop()
+
+    model.featuresToVector = tracked_embed
+
+    async def listen_all():
+        with ThreadPoolExecutor(4) as executor:
+            return await asyncio.gather(
+                *[
+                    collect_matches(detector(model, reference_file), wav_file, executor)
+                    for _ in range(4)
+                ]
+            )
+
+    results = asyncio.run(listen_all())
+
+    assert max(max_active) == 1
+    assert all(len(matches) > 0 for matches in results)
+    assert all(matches == results[0] for matches in results)
@@ -0,0 +1,76 @@
+"""
+float32 LogfbankExtractor against the float64 logfbank reference
+"""
+
+import threading
+
+import numpy as np
+
+from eff_word_net.audio_utils import LogfbankExtractor, logfbank
+
+# Resnet50_Arc_loss feature settings
+FEATURE_KWARGS = dict(samplerate=16000, winlen=0.025, winstep=0.01, nfilt=64, nfft=512, preemph=0.0)
+
+
+def reference_features(signal):
+    return logfbank(signal, winfunc=None, **FEATURE_KWARGS)
+
+
+def speech_like(rng, n, batch=()):
+    # noise with a slow envelope, so bands span a wide dynamic range
+    envelope = np.abs(np.sin(np.linspace(0, 6 * np.pi, n)))
+    return rng.standard_normal(batch + (n,)) * envelope * 0.3
+
+
+def test_single_window_matches_logfbank():
+    window = speech_like(np.random.default_rng(0), 24000)
+    extractor = LogfbankExtractor(dtype=np.float32, **FEATURE_KWARGS)
+
+    features = extractor(window)
+
+    assert features.dtype == np.float32
+    np.testing.assert_allclose(features, reference_features(window), atol=1e-4, rtol=0)
+
+
+def test_batch_matches_logfbank():
+    batch = speech_like(np.random.default_rng(1), 24000, batch=(5,))
+    extractor = LogfbankExtractor(dtype=np.float32, **FEATURE_KWARGS)
+
+    features = extractor(batch)
+
+    assert features.shape[0] == 5
+    np.testing.assert_allclose(features, reference_features(batch), atol=1e-4, rtol=0)
+
+
+def test_silence_matches_logfbank():
+    silence = np.zeros(24000)
+    extractor = LogfbankExtractor(dtype=np.float32, **FEATURE_KWARGS)
+
+    features = extractor(silence)
+
+    np.testing.assert_allclose(features, reference_features(silence), atol=1e-4, rtol=0)
+
+
+def test_shared_extractor_across_threads():
+    rng = np.random.default_rng(2)
+    windows = speech_like(rng, 24000, batch=(8,))
+    expected = reference_features(windows)
+    extractor = LogfbankExtractor(dtype=np.float32, **FEATURE_KWARGS)
+    errors = []
+    barrier = threading.Barrier(len(windows))
+
+    def extract(i):
+        barrier.wait()
+        for _ in range(20):
+            features = extractor(windows[i])
+            error = np.abs(features - expected[i]).max()
+            if error > 1e-4:
+                errors.append(error)
+
+    threads = [threading.Thread(target=extract, args=(i,)) for i in range(len(windows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
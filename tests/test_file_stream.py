@@ -0,0 +1,115 @@
+import numpy as np
+import soundfile as sf
+
+from conftest import background, hotword_audio
+from eff_word_net import RATE
+from eff_word_net.engine import HotwordDetector
+from eff_word_net.scan import scan_file
+from eff_word_net.streams import FileAudioStream
+
+
+def write_recording(path, starts_secs, secs=12.0):
+    audio = background(secs, seed=7)
+    chirp = hotword_audio()
+    for start in starts_secs:
+        offset = int(start * RATE)
+        audio[offset : offset + chirp.shape[0]] += chirp
+    sf.write(path, audio, RATE)
+
+
+def detector(model, reference_file, clock=None):
+    return HotwordDetector(
+        hotword="chirp",
+        model=model,
+        reference_file=reference_file,
+        threshold=0.85,
+        relaxation_time=2,
+        clock=clock,
+    )
+
+
+def stream_matches(stream, hotword):
+    """
+    Runs a mic style loop over the stream, returns the timeline ends of the
+    matching windows
+    """
+    ends = []
+    stream.start_stream()
+    while True:
+        frame = stream.getFrame()
+        if frame is None:
+            break
+        if hotword.scoreFrame(frame, unsafe=True)["match"]:
+            ends.append(stream.timeline_secs)
+    stream.close_stream()
+    return ends
+
+
+def scanned_ends(path, model, reference_file):
+    return [
+        detection["end"]
+        for detection in scan_file(path, model, detector(model, reference_file), hop_secs=0.25)
+    ]
+
+
+def test_timeline_clock_matches_scan_file(tmp_path, model, reference_file):
+    path = str(tmp_path / "recording.wav")
+    write_recording(path, [1.0, 4.0, 7.0, 10.0])
+
+    scanned = scanned_ends(path, model, reference_file)
+    assert len(scanned) == 4
+
+    stream = FileAudioStream(path, window_length_secs=1.5, sliding_window_secs=0.25)
+    hotword = detector(model, reference_file, clock=lambda: stream.timeline_secs)
+    assert np.allclose(stream_matches(stream, hotword), scanned)
+
+
+def test_timeline_clock_detects_hotword_at_file_start(tmp_path, model, reference_file):
+    path = str(tmp_path / "recording.wav")
+    write_recording(path, [0.2, 3.5])
+
+    scanned = scanned_ends(path, model, reference_file)
+    assert len(scanned) == 2
+
+    stream = FileAudioStream(path, window_length_secs=1.5, sliding_window_secs=0.25)
+    hotword = detector(model, reference_file, clock=lambda: stream.timeline_secs)
+    ends = stream_matches(stream, hotword)
+    assert len(ends) == 2
+    # the stream window holding the first hotword is zero padded before the
+    # file start, it can match up to a window earlier than scan_file
+    assert scanned[0] - 1.5 <= ends[0] <= scanned[0]
+    assert np.isclose(ends[1], scanned[1])
+
+
+def test_timeline_clock_restarted_stream_detects_again(tmp_path, model, reference_file):
+    path = str(tmp_path / "recording.wav")
+    write_recording(path, [0.2, 4.0, 7.0])
+
+    stream = FileAudioStream(path, window_length_secs=1.5, sliding_window_secs=0.25)
+    hotword = detector(model, reference_file, clock=lambda: stream.timeline_secs)
+    first = stream_matches(stream, hotword)
+    assert len(first) == 3
+    assert stream_matches(stream, hotword) == first
+
+
+def test_wall_clock_relaxation_merges_file_detections(tmp_path, model, reference_file):
+    path = str(tmp_path / "recording.wav")
+    write_recording(path, [1.0, 4.0, 7.0, 10.0])
+
+    stream = FileAudioStream(path, window_length_secs=1.5, sliding_window_secs=0.25)
+    # the whole file is read well within relaxation_time of wall clock, so
+    # detections 3 secs apart in the recording suppress each other
+    assert len(stream_matches(stream, detector(model, reference_file))) < 4
+
+
+def test_timeline_restarts_with_stream(tmp_path):
+    path = str(tmp_path / "recording.wav")
+    write_recording(path, [], secs=3.0)
+
+    stream = FileAudioStream(path, window_length_secs=1.5, sliding_window_secs=0.25)
+    for _ in range(2):
+        stream.start_stream()
+        while stream.getFrame() is not None:
+            pass
+        assert np.isclose(stream.timeline_secs, 3.0)
+        stream.close_stream()
@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from eff_word_net.audio_processing import Resnet50_Arc_loss
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+
+def scaling_model(path, scale):
+    """
+    Stand-in graph for a model variant, the embedding is the frame mean of
+    the features times scale
+    """
+    from onnx import TensorProto, helper
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["features"], ["mean"], axes=[1, 2], keepdims=0),
+            helper.make_node("Mul", ["mean", "scale"], ["embedding"]),
+        ],
+        "variant",
+        [helper.make_tensor_value_info("features", TensorProto.FLOAT, ["batch", 1, 151, 64])],
+        [helper.make_tensor_value_info("embedding", TensorProto.FLOAT, ["batch", 64])],
+        [helper.make_tensor("scale", TensorProto.FLOAT, [], [scale])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+
+@pytest.fixture
+def variant_models(tmp_path, monkeypatch):
+    paths = {
+        False: scaling_model(str(tmp_path / "fp32.onnx"), 1.0),
+        True: scaling_model(str(tmp_path / "int8.onnx"), 2.0),
+    }
+    monkeypatch.setattr(
+        Resnet50_Arc_loss, "_modelPath", lambda self: paths[self.use_quantized_model]
+    )
+    return paths
+
+
+def embedding(model):
+    features = np.ones((1, 1, 151, 64), dtype=np.float32)
+    return model.onnx_sess.run(None, {model.input_name: features})[0][0, 0]
+
+
+def test_cache_is_rebuilt_for_another_variant(tmp_path, variant_models):
+    cache = str(tmp_path / "model.opt.onnx")
+
+    fp32 = Resnet50_Arc_loss(lazy=True, optimized_model_path=cache)
+    assert embedding(fp32) == 1.0
+    assert os.path.isfile(cache)
+    assert json.loads(open(cache + ".json").read())["model_variant"] == "fp32"
+
+    int8 = Resnet50_Arc_loss(lazy=True, use_quantized_model=True, optimized_model_path=cache)
+    assert int8.model_variant == "int8"
+    assert embedding(int8) == 2.0
+    assert json.loads(open(cache + ".json").read())["model_variant"] == "int8"
+
+
+def test_matching_cache_is_loaded(tmp_path, variant_models):
+    cache = str(tmp_path / "model.opt.onnx")
+    embedding(Resnet50_Arc_loss(lazy=True, optimized_model_path=cache))
+    built = os.path.getmtime(cache)
+
+    os.utime(cache, (built - 100, built - 100))
+    assert embedding(Resnet50_Arc_loss(lazy=True, optimized_model_path=cache)) == 1.0
+    # loaded, not rewritten
+    assert os.path.getmtime(cache) == built - 100
+
+
+def test_cache_is_rebuilt_for_other_optimization_level(tmp_path, variant_models):
+    cache = str(tmp_path / "model.opt.onnx")
+    embedding(Resnet50_Arc_loss(lazy=True, optimized_model_path=cache))
+
+    model = Resnet50_Arc_loss(
+        lazy=True, optimized_model_path=cache, graph_optimization_level="basic"
+    )
+    embedding(model)
+    assert json.loads(open(cache + ".json").read())["graph_optimization_level"] == "basic"
+
+
+def test_cache_without_build_info_is_rebuilt(tmp_path, variant_models):
+    cache = str(tmp_path / "model.opt.onnx")
+    # a cache of the int8 graph left by a version without build info
+    scaling_model(cache, 2.0)
+
+    assert embedding(Resnet50_Arc_loss(lazy=True, optimized_model_path=cache)) == 1.0
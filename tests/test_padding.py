@@ -0,0 +1,113 @@
+"""
+Vectorized padding trim against the original element by element loop
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from eff_word_net.audio_processing import ModelRawBackend
+
+
+def original_remove_existing_padding(x):
+    # ModelRawBackend._removeExistingPadding before vectorization
+    lastZeroBitBeforeAudio = 0
+    firstZeroBitAfterAudio = len(x)
+    for i in range(len(x)):
+        if x[i] == 0:
+            lastZeroBitBeforeAudio = i
+        else:
+            break
+    for i in range(len(x) - 1, 1, -1):
+        if x[i] == 0:
+            firstZeroBitAfterAudio = i
+        else:
+            break
+    return x[lastZeroBitBeforeAudio:firstZeroBitAfterAudio]
+
+
+def binary_arrays(max_length):
+    for length in range(max_length + 1):
+        for bits in itertools.product((0.0, 1.0), repeat=length):
+            yield np.array(bits)
+
+
+@pytest.fixture
+def backend():
+    backend = ModelRawBackend()
+    backend.window_frames = 8
+    return backend
+
+
+def test_trim_matches_original_on_all_binary_arrays(backend):
+    for x in binary_arrays(10):
+        expected = original_remove_existing_padding(x)
+        trimmed = backend._removeExistingPadding(x)
+        assert trimmed.shape == expected.shape, x
+        assert np.array_equal(trimmed, expected), x
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 10])
+def test_trim_matches_original_on_silence(backend, length):
+    x = np.zeros(length)
+    assert np.array_equal(backend._removeExistingPadding(x), original_remove_existing_padding(x))
+
+
+def test_trim_matches_original_on_signed_audio(backend):
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        length = int(rng.integers(0, 16))
+        x = rng.standard_normal(length) * (rng.random(length) < 0.5)
+        assert np.array_equal(
+            backend._removeExistingPadding(x), original_remove_existing_padding(x)
+        )
+
+
+def test_batch_trim_bounds_match_original(backend):
+    clips = np.stack(list(binary_arrays(10))[-(2**10) :])
+    starts, ends = backend._trimBounds(clips)
+    for clip, start, end in zip(clips, starts, ends):
+        assert np.array_equal(clip[start:end], original_remove_existing_padding(clip))
+
+
+def test_threshold_trims_quiet_samples(backend):
+    x = np.array([0.001, 0.0, 0.5, -0.2, 0.0005, 0.0])
+    assert np.array_equal(backend._removeExistingPadding(x, threshold=0.01), [0.0, 0.5, -0.2])
+
+
+def test_batch_windows_are_crops_or_pads_of_the_trimmed_clips(backend):
+    rng = np.random.default_rng(1)
+    clips = [
+        np.concatenate(
+            (
+                np.zeros(rng.integers(0, 4)),
+                rng.standard_normal(rng.integers(0, 16)),
+                np.zeros(rng.integers(0, 4)),
+            )
+        )
+        for _ in range(300)
+    ]
+    windows = backend.fixPaddingIssuesBatch(clips, rng=np.random.default_rng(2))
+
+    assert windows.shape == (len(clips), backend.window_frames)
+    assert windows.dtype == np.float32
+    for clip, window in zip(clips, windows):
+        trimmed = original_remove_existing_padding(clip).astype(np.float32)
+        n, frames = trimmed.shape[0], backend.window_frames
+        if n >= frames:
+            placements = [trimmed[s : s + frames] for s in range(n - frames + 1)]
+        else:
+            placements = [
+                np.concatenate((np.zeros(s), trimmed, np.zeros(frames - n - s)))
+                for s in range(frames - n + 1)
+            ]
+        assert any(np.array_equal(window, p) for p in placements)
+
+
+def test_augmented_windows_are_reproducible(backend):
+    x = np.concatenate((np.zeros(3), np.random.default_rng(3).standard_normal(20)))
+    windows = backend.augmentedWindows(x, n_variants=4, seed=7)
+
+    assert np.array_equal(windows, backend.augmentedWindows(x, n_variants=4, seed=7))
+    assert not np.array_equal(windows, backend.augmentedWindows(x, n_variants=4, seed=8))
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from eff_word_net.engine import HotwordDetector
+from eff_word_net.reference import ReferenceFormat, load_reference, save_reference
+
+
+pytestmark = pytest.mark.skipif(
+    not os.path.isdir("/proc/self/fd"), reason="counts file descriptors in /proc"
+)
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def binary_reference(path, seed=0):
+    rng = np.random.default_rng(seed)
+    arrays = {
+        "embeddings": rng.standard_normal((6, 8)).astype(np.float32),
+        "prototypes": rng.standard_normal((2, 8)).astype(np.float32),
+        "prototype_counts": np.array([4, 2]),
+        "templates": rng.standard_normal((3, 5)).astype(np.float32),
+    }
+    save_reference(
+        path,
+        arrays,
+        {"model_type": "resnet_50_arc", "model_variant": "fp32"},
+        ReferenceFormat.binary,
+    )
+    return arrays
+
+
+def test_mmap_and_read_arrays_match(tmp_path):
+    path = str(tmp_path / "ref.bin")
+    arrays = binary_reference(path)
+    for mmap in (True, False):
+        data = load_reference(path, mmap=mmap)
+        for name, arr in arrays.items():
+            np.testing.assert_array_equal(data[name], arr)
+        assert data["model_type"] == "resnet_50_arc"
+
+
+def test_mmap_maps_each_file_once(tmp_path):
+    paths = [str(tmp_path / f"{i}_ref.bin") for i in range(20)]
+    for i, path in enumerate(paths):
+        binary_reference(path, seed=i)
+
+    before = open_fds()
+    loaded = [load_reference(path) for path in paths]
+    assert open_fds() - before <= len(paths)
+    del loaded
+
+
+def test_detectors_keep_no_reference_file_open(tmp_path, model):
+    paths = [str(tmp_path / f"{i}_ref.bin") for i in range(50)]
+    for i, path in enumerate(paths):
+        binary_reference(path, seed=i)
+
+    before = open_fds()
+    detectors = [
+        HotwordDetector(hotword=str(i), model=model, reference_file=path, use_prototypes=True)
+        for i, path in enumerate(paths)
+    ]
+    assert open_fds() == before
+    assert detectors[0].embeddings.shape == (2, 8)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from eff_word_net import RATE
+from eff_word_net.resample import PolyphaseResampler, resample_audio
+
+RATES = [8000, 16000, 22050, 32000, 44100, 48000]
+
+
+def tones(freqs, rate, secs=1.0):
+    t = np.arange(int(secs * rate)) / rate
+    return sum(np.sin(2 * np.pi * f * t + i) for i, f in enumerate(freqs)).astype(np.float32)
+
+
+@pytest.mark.parametrize("orig_rate", RATES)
+def test_chunked_output_matches_whole(orig_rate):
+    rng = np.random.default_rng(orig_rate)
+    audio = rng.standard_normal(orig_rate + 123).astype(np.float32)
+
+    resampler = PolyphaseResampler(orig_rate)
+    out, start = [], 0
+    while start < audio.shape[0]:
+        size = int(rng.integers(1, 3000))
+        out.append(resampler.process(audio[start : start + size]))
+        start += size
+    out.append(resampler.flush())
+
+    np.testing.assert_allclose(np.concatenate(out), resample_audio(audio, orig_rate), atol=1e-6)
+
+
+@pytest.mark.parametrize("orig_rate", RATES)
+@pytest.mark.parametrize("n", [0, 1, 7, 1000, 44101])
+def test_output_length(orig_rate, n):
+    out = resample_audio(np.zeros(n, dtype=np.float32), orig_rate)
+    assert out.shape[0] == -(-n * RATE // orig_rate)
+
+
+@pytest.mark.parametrize("orig_rate", RATES)
+def test_in_band_tones_match_tones_sampled_at_16k(orig_rate):
+    # the exact band limited resampling of a tone is the tone sampled at 16kHz
+    freqs = [440.0, 1900.0, 0.35 * min(orig_rate, RATE)]
+    out = resample_audio(tones(freqs, orig_rate, secs=2), orig_rate)
+    expected = tones(freqs, RATE, secs=2)[: out.shape[0]]
+
+    # filter warm up and tail dont count
+    margin = RATE // 4
+    error = out[margin:-margin] - expected[margin:-margin]
+    snr = 10 * np.log10(np.sum(expected[margin:-margin] ** 2) / (np.sum(error**2) + 1e-12))
+    assert snr > 60
+
+
+@pytest.mark.parametrize("orig_rate", [22050, 32000, 44100, 48000])
+def test_tone_above_8k_is_rejected(orig_rate):
+    alias = RATE / 2 + 0.3 * (orig_rate - RATE) / 2
+    out = resample_audio(tones([alias], orig_rate, secs=2), orig_rate)
+
+    margin = RATE // 4
+    rms = np.sqrt(np.mean(out[margin:-margin] ** 2))
+    rejection = -20 * np.log10(rms / np.sqrt(0.5))
+    assert rejection > 60
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from eff_word_net.server import BatchingInferenceServer
+
+
+class FiniteStream:
+    """
+    getFrame returns n_frames windows, then None like FileAudioStream
+    """
+
+    def __init__(self, window_frames: int, n_frames: int):
+        self.window = np.zeros(window_frames, dtype=np.float32)
+        self.frames_left = n_frames
+        self.calls = 0
+
+    def getFrame(self):
+        self.calls += 1
+        if self.frames_left == 0:
+            return None
+        self.frames_left -= 1
+        return self.window
+
+
+def test_attached_stream_stops_at_end_of_stream(model):
+    stream = FiniteStream(model.window_frames, 3)
+    results = []
+    done = threading.Event()
+
+    def callback(result):
+        results.append(result)
+        if len(results) == 3:
+            done.set()
+
+    with BatchingInferenceServer(model, max_wait_ms=1) as server:
+        pump = server.attachStream(stream, None, callback)
+        pump.join(timeout=5)
+        assert not pump.is_alive()
+        assert done.wait(timeout=5)
+
+    assert stream.calls == 4
+    assert len(results) == 3
+
+
+def test_bad_window_is_rejected_on_submit(model):
+    with BatchingInferenceServer(model, max_wait_ms=50) as server:
+        good = [
+            server.submitFrame(np.zeros(model.window_frames, dtype=np.float32))
+            for _ in range(3)
+        ]
+        with pytest.raises(AssertionError):
+            server.submitFrame(None)
+        with pytest.raises(AssertionError):
+            server.submitFrame(np.zeros(100))
+        embeddings = [future.result(timeout=5) for future in good]
+
+    assert all(embedding.shape == (1, 64) for embedding in embeddings)
+
+
+class EndlessStream:
+    def __init__(self, window_frames: int):
+        self.window = np.zeros(window_frames, dtype=np.float32)
+
+    def getFrame(self):
+        time.sleep(0.001)
+        return self.window
+
+
+def test_stop_with_running_pumps_leaves_no_pending_future(model, monkeypatch):
+    errors = []
+    monkeypatch.setattr(threading, "excepthook", lambda args: errors.append(args.exc_value))
+
+    for _ in range(10):
+        server = BatchingInferenceServer(model, max_batch_size=4, max_wait_ms=1)
+        futures = []
+        enqueue = server._enqueue
+
+        def recording_enqueue(*args):
+            future = enqueue(*args)
+            if future is not None:
+                futures.append(future)
+            return future
+
+        server._enqueue = recording_enqueue
+        server.start()
+        pumps = [
+            server.attachStream(EndlessStream(model.window_frames), None, lambda r: None)
+            for _ in range(8)
+        ]
+        while len(futures) < 50:
+            time.sleep(0.001)
+        server.stop()
+
+        for pump in pumps:
+            pump.join(timeout=5)
+            assert not pump.is_alive()
+        assert all(future.done() for future in futures)
+        assert server.queue_depth == 0
+
+    assert errors == []
+
+
+def test_submit_after_stop_is_rejected(model):
+    server = BatchingInferenceServer(model)
+    server.start()
+    server.stop()
+    with pytest.raises(AssertionError):
+        server.submitFrame(np.zeros(model.window_frames, dtype=np.float32))
@@ -0,0 +1,186 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from eff_word_net import RATE
+from eff_word_net.streams import (
+    CustomAudioStream,
+    InferenceThread,
+    RingBuffer,
+    ThreadedAudioStream,
+)
+
+WINDOW_SECS = 1.5
+HOP_SECS = 0.25
+HOP = int(HOP_SECS * RATE)
+
+
+def fake_source(audio: np.array, chunk: int, delay: float = 0):
+    """
+    read_chunk over audio in chunks of chunk samples, None at the end
+    """
+    position = [0]
+
+    def read_chunk():
+        if delay:
+            time.sleep(delay)
+        start = position[0]
+        if start >= audio.shape[0]:
+            return None
+        position[0] += chunk
+        return audio[start : start + chunk]
+
+    return read_chunk
+
+
+def windows(stream) -> list:
+    out = []
+    stream.start_stream()
+    while (frame := stream.getFrame()) is not None:
+        out.append(frame.copy())
+    stream.close_stream()
+    return out
+
+
+@pytest.mark.parametrize("chunk", [HOP, 1000, 3 * HOP + 7])
+def test_windows_match_custom_audio_stream(chunk):
+    audio = np.random.default_rng(0).standard_normal(6 * RATE)
+    threaded = windows(
+        ThreadedAudioStream(
+            lambda: None,
+            lambda: None,
+            read_chunk=fake_source(audio, chunk),
+            window_length_secs=WINDOW_SECS,
+            sliding_window_secs=HOP_SECS,
+            buffer_secs=10,
+        )
+    )
+
+    hops = iter(audio.reshape(-1, HOP))
+    custom = CustomAudioStream(
+        lambda: None,
+        lambda: None,
+        lambda: next(hops),
+        window_length_secs=WINDOW_SECS,
+        sliding_window_secs=HOP_SECS,
+    )
+    custom.start_stream()
+    # the warmup in start_stream consumes RATE // HOP - 1 hops
+    n_windows = audio.shape[0] // HOP - RATE // HOP + 1
+    expected = [custom.getFrame().copy() for _ in range(n_windows)]
+
+    assert len(threaded) == len(expected)
+    for got, want in zip(threaded, expected):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_slow_consumer_drops_chunks():
+    audio = np.zeros(8 * RATE)
+    stream = ThreadedAudioStream(
+        lambda: None,
+        lambda: None,
+        # a source paced 5 times faster than the consumer
+        read_chunk=fake_source(audio, HOP, delay=0.002),
+        window_length_secs=WINDOW_SECS,
+        sliding_window_secs=HOP_SECS,
+        buffer_secs=2 * HOP_SECS,
+    )
+    stream.start_stream()
+    frames = 0
+    while stream.getFrame() is not None:
+        frames += 1
+        time.sleep(0.01)
+    stream.close_stream()
+
+    assert stream.captured_chunks == audio.shape[0] // HOP
+    assert stream.dropped_chunks > 0
+    # every captured hop is either dropped or read, 3 by the warmup
+    assert frames + 3 + stream.dropped_chunks == stream.captured_chunks
+
+
+def test_get_frame_returns_none_once_source_is_exhausted():
+    stream = ThreadedAudioStream(
+        lambda: None,
+        lambda: None,
+        read_chunk=fake_source(np.zeros(RATE + HOP // 2), HOP),
+        window_length_secs=WINDOW_SECS,
+        sliding_window_secs=HOP_SECS,
+    )
+    stream.start_stream()
+    assert stream.getFrame() is not None
+    # the trailing half hop never makes a window
+    assert stream.getFrame() is None
+    assert stream.getFrame() is None
+    stream.close_stream()
+
+
+def test_get_frame_returns_none_once_stream_is_closed():
+    hops = [np.zeros(HOP)] * (RATE // HOP - 1)
+
+    def read_chunk():
+        # enough audio for the warmup, then a live source gone quiet
+        if hops:
+            return hops.pop()
+        time.sleep(0.01)
+        return np.zeros(0)
+
+    stream = ThreadedAudioStream(
+        lambda: None,
+        lambda: None,
+        read_chunk=read_chunk,
+        window_length_secs=WINDOW_SECS,
+        sliding_window_secs=HOP_SECS,
+    )
+    stream.start_stream()
+
+    results = []
+    consumer = threading.Thread(target=lambda: results.append(stream.getFrame()))
+    consumer.start()
+    time.sleep(0.05)
+    assert consumer.is_alive()
+    stream.close_stream()
+    consumer.join(timeout=5)
+    assert results == [None]
+
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(5)
+    out2, out5 = np.zeros(2), np.zeros(5)
+
+    assert ring.write(np.array([1.0, 2.0, 3.0]))
+    assert ring.read(out2)
+    np.testing.assert_array_equal(out2, [1, 2])
+
+    # 3 at index 2, then 4 5 6 7 wrapping past the end
+    assert ring.write(np.array([4.0, 5.0, 6.0, 7.0]))
+    assert ring.available == 5
+    assert not ring.write(np.array([8.0]))
+    assert ring.read(out5)
+    np.testing.assert_array_equal(out5, [3, 4, 5, 6, 7])
+
+    assert not ring.read(out2)
+    assert ring.available == 0
+
+
+def test_inference_thread_scores_every_window():
+    audio = np.random.default_rng(1).standard_normal(3 * RATE)
+    stream = ThreadedAudioStream(
+        lambda: None,
+        lambda: None,
+        read_chunk=fake_source(audio, HOP),
+        window_length_secs=WINDOW_SECS,
+        sliding_window_secs=HOP_SECS,
+        buffer_secs=10,
+    )
+    results = []
+    stream.start_stream()
+    worker = InferenceThread(stream, lambda frame: float(frame[-1]), results.append)
+    worker.start()
+    worker.join(timeout=5)
+    stream.close_stream()
+
+    ends = audio.reshape(-1, HOP)[RATE // HOP - 1 :, -1]
+    assert worker.frames_scored == len(ends)
+    np.testing.assert_array_equal(results, ends)